@@ -232,8 +232,8 @@ def harmonize_data(
         }
         # Run model
         model = mod.Model(df, config)
-        df_prep, tbl = model.prep()
-        df_results = model.analysis(df_prep.copy(), tbl)
+        tbl = model.prep_tables()
+        df_results = model.analysis(None, tbl)
 
         # Update the layout with new results
         new_layout = alf.run_layout_build(df_results)
@@ -1,13 +1,19 @@
 from typing import Any
 from pandas import DataFrame
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict
 from typing import List
+from typing import Optional
 from typing import Tuple
+from typing import Union
 
 import os
 import yaml
+import numpy as np
+import pandas as pd
 
 import src.model_classes as mc 
+import src.model_functions as mf
 
 package_dir = os.path.dirname(os.path.abspath(__file__))
 config_fp = os.path.join(package_dir, "config.yaml")
@@ -32,6 +38,461 @@ class Model:
         
         self.config = config
 
+    def run(
+        self
+    ) -> DataFrame:
+        
+        """
+        Runs prep_tables and analysis. With a 'ResultCache'
+        config section (cache_dir) the results are stored
+        keyed by the input file content and the Ingest and
+        StatsTesting2x2Cont sections, and a repeat run
+        with unchanged data and config loads them instead.
+        """
+        
+        config = self.config
+        
+        cache_config = config.get("ResultCache")
+        
+        if cache_config is None:
+            return self.analysis(None, self.prep_tables())
+        
+        try:
+            cache_dir = cache_config["cache_dir"]
+            filepath = config["Ingest"]["filepath"]
+        
+        except KeyError as e:
+            raise KeyError(
+                f"Missing key '{e.args[0]}' in the config file. "
+                f"Ensure all required keys are present in the 'Ingest' and 'ResultCache' sections."
+            )
+        
+        cache = mc.ResultCache(cache_dir)
+        key = cache.gen_key(filepath, config)
+        
+        df_result = cache.get(key)
+        
+        if df_result is None:
+            df_result = self.analysis(None, self.prep_tables())
+            cache.put(key, df_result)
+        
+        return df_result
+    
+    def run_sweep(
+        self,
+        variants: Optional[List[Dict[str, Any]]] = None
+    ) -> DataFrame:
+        
+        """
+        Runs several config variants over one load of
+        the input file.
+        
+        Each variant holds section overrides merged into
+        the config, e.g. {'name': 'race', 'Ingest':
+        {'group_variable': 'race', ...}}, and an optional
+        name, defaulting to its position. The columns of
+        every variant are read once and encoded as
+        categorical codes, which the variants read from
+        shared memory on a pool of the 'Sweep' section's
+        n_workers (default 1) processes to count their
+        tables, see model_functions.run_sweep_variant.
+        The tables are tested here.
+        
+        :param variants:
+            Optional[List[Dict[str, Any]]], defaults to the
+            'Sweep' section's variants.
+        :return df_result:
+            DataFrame, the analysis results of every
+            variant, tagged by the 'variant' column.
+        """
+        
+        config = self.config
+        
+        sweep_config = config.get("Sweep", {})
+        
+        try:
+            variants = sweep_config["variants"] if variants is None else variants
+            n_workers: int = sweep_config.get("n_workers", 1)
+            
+            if not isinstance(variants, list) or not all(
+                isinstance(i, dict) for i in variants
+            ):
+                raise TypeError("Expected 'variants' to be a list of dicts.")
+            if not isinstance(n_workers, int) or n_workers <= 0:
+                raise TypeError("Expected 'n_workers' to be a positive 'int'.")
+        
+        except KeyError as e:
+            raise KeyError(
+                f"Missing key '{e.args[0]}' in the config file. "
+                f"Ensure all required keys are present in the 'Sweep' section."
+            )
+        
+        except TypeError as e:
+            raise TypeError(f"Config file error: {e}")
+        
+        names = [str(i.get("name", n)) for n, i in enumerate(variants)]
+        configs = [self._gen_variant_config(i) for i in variants]
+        preps = [mc.Ingest(i) for i in configs]
+        
+        if len({i.filepath for i in preps}) > 1:
+            raise ValueError("Expected every sweep variant to read the same 'filepath'.")
+        
+        usecols = list(dict.fromkeys(
+            col for i in preps for col in i._gen_usecols()
+        ))
+        
+        df = preps[0].run_load(usecols=usecols)
+        
+        codes = {col: df[col].cat.codes.to_numpy() for col in usecols}
+        categories = {col: df[col].cat.categories for col in usecols}
+        
+        del df
+        
+        blocks, spec = mf.gen_shared_arrays(codes)
+        
+        del codes
+        
+        try:
+            if n_workers > 1 and len(configs) > 1:
+                with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                    tbls = list(executor.map(
+                        mf.run_sweep_variant,
+                        configs,
+                        [spec] * len(configs),
+                        [categories] * len(configs)
+                    ))
+            else:
+                tbls = [
+                    mf.run_sweep_variant(i, spec, categories)
+                    for i in configs
+                ]
+        
+        finally:
+            mf.gen_release_shared(blocks)
+        
+        results = [
+            Model(i).analysis(None, tbl)
+            for i, tbl in zip(configs, tbls)
+        ]
+        
+        for name, df_result in zip(names, results):
+            df_result.insert(0, 'variant', name)
+        
+        df_result = pd.concat(results, ignore_index=True)
+        
+        return df_result
+    
+    def _gen_variant_config(
+        self,
+        variant: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        
+        """
+        Merges the section overrides of a sweep
+        variant into the config.
+        """
+        
+        config = self.config
+        
+        variant_config = {
+            **config,
+            **{
+                sec: {**config.get(sec, {}), **val}
+                for sec, val in variant.items()
+                if isinstance(val, dict)
+            }
+        }
+        
+        return variant_config
+    
+    def run_partial(
+        self,
+        filepath: str
+    ) -> mc.CountPartial:
+        
+        """
+        Map step of a sharded run, counts this config's
+        input and saves the tables as a CountPartial
+        .npz file for run_merge.
+        
+        :param filepath:
+            str, output .npz path relative to the main dir.
+        :return partial:
+            CountPartial
+        """
+        
+        partial = self._prep_partial()
+        partial.save(filepath)
+        
+        return partial
+    
+    def _prep_partial(
+        self
+    ) -> mc.CountPartial:
+        
+        """
+        Counts this config's input into a CountPartial.
+        """
+        
+        prep = mc.Ingest(self.config)
+        tbl = self.prep_tables()
+        
+        if not prep.batch:
+            tbl = {prep.grpers_val: tbl}
+        
+        partial = mc.CountPartial.from_tables(tbl, prep)
+        
+        return partial
+    
+    def run_update(
+        self,
+        state_filepath: str,
+        delta_filepath: Optional[str] = None,
+        retract_filepath: Optional[str] = None
+    ) -> DataFrame:
+        
+        """
+        Updates a persistent per-segment count state from
+        delta files and re-tests the changed segments.
+        
+        The delta file holds new records and the retract
+        file the old versions of corrected records, both
+        in the input layout; their counts are added to,
+        and subtracted from, the CountPartial state at
+        state_filepath, which starts empty when missing.
+        Only the segments whose counts changed are tested.
+        With a correction ('correction') every state table
+        is tested, so the adjusted pvalues do not depend
+        on how many segments changed, and the rows of the
+        changed segments are returned.
+        
+        :param state_filepath:
+            str, .npz state path relative to the main dir.
+        :param delta_filepath:
+            Optional[str], csv of records to add.
+        :param retract_filepath:
+            Optional[str], csv of records to retract.
+        :return df_result:
+            DataFrame, testing results of the changed
+            segments, empty when nothing changed.
+        """
+        
+        config = self.config
+        
+        prep = mc.Ingest(config)
+        
+        if os.path.exists(os.path.join(package_dir, state_filepath)):
+            state = mc.CountPartial.load(state_filepath)
+        else:
+            state = mc.CountPartial.from_tables({}, prep)
+        
+        state_new = state
+        
+        for filepath, sign in ((delta_filepath, 1), (retract_filepath, -1)):
+            if filepath is None:
+                continue
+            
+            delta = Model(
+                {**config, "Ingest": {**config["Ingest"], "filepath": filepath}}
+            )._prep_partial()
+            
+            state_new = state_new.merge(delta, sign=sign)
+        
+        changed = state_new.gen_changed_keys(state)
+        
+        state_new.save(state_filepath)
+        
+        if not changed:
+            return pd.DataFrame()
+        
+        tbls = state_new.to_tables()
+        
+        if not prep.batch:
+            return self.analysis(None, tbls[prep.grpers_val])
+        
+        if mc.StatsTesting2x2Cont(config=config, tbl=None).correction is None:
+            return self.analysis(None, {key: tbls[key] for key in changed})
+        
+        changed = set(changed)
+        
+        df_result = self.analysis(None, tbls)
+        df_result = df_result.loc[
+            [key in changed for key in tbls]
+        ].reset_index(drop=True)
+        
+        return df_result
+    
+    def run_merge(
+        self,
+        filepaths: List[str]
+    ) -> DataFrame:
+        
+        """
+        Reduce step of a sharded run, merges the
+        CountPartial files of run_partial and runs the
+        analysis on the combined tables.
+        
+        :param filepaths:
+            List[str], .npz paths relative to the main dir.
+        :return df_result:
+            DataFrame, testing results.
+        """
+        
+        prep = mc.Ingest(self.config)
+        
+        partial = mc.CountPartial.merge_all(
+            mc.CountPartial.load(i) for i in filepaths
+        )
+        tbls = partial.to_tables()
+        
+        if prep.batch:
+            tbl = tbls
+        else:
+            tbl = tbls.get(prep.grpers_val, [[0, 0], [0, 0]])
+        
+        df_result = self.analysis(None, tbl)
+        
+        return df_result
+    
+    def run_map_reduce(
+        self,
+        filepaths: List[str],
+        partial_dir: str,
+        n_workers: int = 1
+    ) -> DataFrame:
+        
+        """
+        Local stand-in for a sharded run, counts every
+        input file into a partial on a process pool, see
+        model_functions.run_partial, and merges the
+        partials with run_merge.
+        
+        :param filepaths:
+            List[str], input csv files, one per shard.
+        :param partial_dir:
+            str, directory for the partial files.
+        :param n_workers:
+            int, number of worker processes.
+        :return df_result:
+            DataFrame, testing results.
+        """
+        
+        config = self.config
+        
+        os.makedirs(os.path.join(package_dir, partial_dir), exist_ok=True)
+        
+        configs = [
+            {**config, "Ingest": {**config["Ingest"], "filepath": i}}
+            for i in filepaths
+        ]
+        partial_fps = [
+            os.path.join(partial_dir, f"partial_{n}.npz")
+            for n in range(len(filepaths))
+        ]
+        
+        if n_workers > 1 and len(configs) > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                list(executor.map(mf.run_partial, configs, partial_fps))
+        else:
+            for i, fp in zip(configs, partial_fps):
+                mf.run_partial(i, fp)
+        
+        df_result = self.run_merge(partial_fps)
+        
+        return df_result
+    
+    def prep_periods(
+        self,
+        filepath: Optional[str] = None
+    ) -> Tuple[pd.PeriodIndex, np.ndarray, np.ndarray]:
+        
+        """
+        Buckets the input into the periods of the
+        Ingest time_variable and counts the
+        (n_periods, n_segments, 2, 2) tensor, see
+        Transform.run_build_period_tensor. The file is
+        loaded whole, chunksize is not used.
+        
+        :param filepath:
+            Optional[str], .npy path relative to the main
+            dir to save the tensor to, see
+            Transform.run_save_period_tensor.
+        :return (periods, labels, tensor):
+            Tuple[pd.PeriodIndex, np.ndarray, np.ndarray]
+        """
+        
+        prep = mc.Ingest(self.config)
+        
+        if prep.time_variable is None:
+            raise KeyError(
+                "Missing key 'time_variable' in the config file. "
+                "Set it in the 'Ingest' section to bucket records into periods."
+            )
+        
+        df_prep: DataFrame = prep.run()
+        
+        trans = mc.Transform(df=df_prep)
+        periods, labels, tensor = trans.run_build_period_tensor(grpers=prep.grpers)
+        
+        del trans, df_prep
+        
+        if filepath is not None:
+            mc.Transform.run_save_period_tensor(filepath, periods, labels, tensor)
+        
+        return periods, labels, tensor
+    
+    def analysis_rolling(
+        self,
+        periods: pd.PeriodIndex,
+        labels: np.ndarray,
+        tensor: np.ndarray,
+        window: int
+    ) -> DataFrame:
+        
+        """
+        Tests every segment over rolling windows of
+        window periods, the window tables come from one
+        cumulative sum, see model_functions.gen_rolling_tables.
+        
+        Rows are the batch report of every
+        (window, segment) table, after the period_end
+        and window columns. Corrections ('correction')
+        are applied across all rows.
+        
+        :param periods, labels, tensor:
+            see prep_periods.
+        :param window:
+            int, number of periods per window.
+        :return df_result:
+            DataFrame, testing results.
+        """
+        
+        config = self.config
+        
+        windows = mf.gen_rolling_tables(tensor, window)
+        n_windows, n_segments = windows.shape[:2]
+        
+        tbls = windows.reshape(-1, 2, 2)
+        
+        seg_labels = np.tile(mc.Transform._gen_label_array(labels), n_windows)
+        
+        period_end = np.repeat(
+            periods[window - 1:].astype(str).to_numpy(), 
+            n_segments
+        )
+        
+        stats = mc.StatsTesting2x2Cont(
+            config=config,
+            tbl=tbls,
+            df=None
+        )
+        df_result: DataFrame = stats.run_testing_batch(seg_labels)
+        
+        df_result.insert(0, 'period_end', period_end)
+        df_result.insert(1, 'window', window)
+        
+        return df_result
+    
     def prep(
         self
     ) -> Tuple[DataFrame, List[float]]:
@@ -44,17 +505,195 @@ class Model:
         
         # ingest
         prep = mc.Ingest(config)
+        
+        if prep.chunksize is not None:
+            return self._prep_stream(prep)
+        
         df_prep: DataFrame = prep.run()
 
         # transform
-        trans = mc.Transform(df=df_prep)
-        tbl: List[float] = trans.run_build_cont_table()
+        tbl = self._prep_tables(prep, df_prep)
         
         return df_prep, tbl
     
+    def prep_tables(
+        self
+    ) -> Union[List[float], Dict[str, List[float]]]:
+        
+        """
+        Tables only alternative to prep, reduces the
+        input straight to the count tables and frees
+        the harmonized DataFrame. Pass the result to
+        analysis with df_prep=None.
+        """
+        
+        config = self.config
+        
+        # ingest
+        prep = mc.Ingest(config)
+        
+        if prep.chunksize is not None:
+            _, tbl = self._prep_stream(prep)
+            return tbl
+        
+        df_prep: DataFrame = prep.run()
+        
+        # transform
+        tbl = self._prep_tables(prep, df_prep)
+        
+        del df_prep
+        
+        return tbl
+    
+    def _prep_tables(
+        self,
+        prep: mc.Ingest,
+        df_prep: DataFrame
+    ) -> Union[List[float], Dict[str, List[float]]]:
+        
+        """
+        Builds the table, or the batch mode tables,
+        from the harmonized DataFrame. With an
+        'Executor' section the batch mode counting runs
+        on a process pool, see _prep_tables_pool.
+        """
+        
+        trans = mc.Transform(df=df_prep)
+        
+        n_workers = self._gen_executor_config()
+        
+        if prep.batch and n_workers > 1:
+            tbl: Dict[str, List[float]] = self._prep_tables_pool(
+                trans=trans,
+                grpers=prep.grpers,
+                n_workers=n_workers
+            )
+        
+        elif prep.batch:
+            tbl: Dict[str, List[float]] = trans.run_build_cont_tables(
+                grpers=prep.grpers
+            )
+        else:
+            tbl: List[float] = trans.run_build_cont_table()
+        
+        return tbl
+    
+    def _prep_tables_pool(
+        self,
+        trans: mc.Transform,
+        grpers: Union[str, List[str]],
+        n_workers: int
+    ) -> Dict[str, List[float]]:
+        
+        """
+        Process pool alternative to
+        Transform.run_build_cont_tables.
+        
+        The harmonized group and outcome codes and the
+        codes of every grpers column are placed in
+        shared memory and each worker indexes and counts
+        one row range, see
+        model_functions.run_count_segments. Only the
+        partial counts are merged here, the segments
+        are numbered in sorted order as in
+        Transform.run_build_segment_index.
+        """
+        
+        df = trans.df
+        
+        codes, uniques = trans.gen_grpers_codes(grpers=grpers)
+        sizes = [max(len(i), 1) for i in uniques]
+        
+        n_rows = len(df)
+        n_flat = int(np.prod(sizes, dtype=np.float64))
+        
+        # dense counts while the code space is no larger than a row range
+        dense = n_flat <= n_rows // n_workers + 1024
+        
+        blocks, spec = mf.gen_shared_arrays({
+            'group': df['group_var_clean'].to_numpy(),
+            'outcome': df['outcome_var_clean'].to_numpy(),
+            **{f'grpers_{i}': col_codes for i, col_codes in enumerate(codes)}
+        })
+        
+        del codes
+        
+        bounds = np.linspace(0, n_rows, n_workers + 1).astype(np.int64).tolist()
+        
+        try:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                results = list(executor.map(
+                    mf.run_count_segments,
+                    [spec] * n_workers,
+                    bounds[:-1],
+                    bounds[1:],
+                    [sizes] * n_workers,
+                    [dense] * n_workers
+                ))
+        
+        finally:
+            mf.gen_release_shared(blocks)
+        
+        # slot 0 of every segment counts its rows outside the table
+        if dense:
+            counts = np.sum([i[1] for i in results], axis=0, dtype=np.int64).reshape(-1, 5)
+            observed = np.flatnonzero(counts.sum(axis=1))
+            counts = counts[observed]
+        else:
+            slots, inverse = np.unique(
+                np.concatenate([i[0] for i in results]), 
+                return_inverse=True
+            )
+            slot_counts = np.bincount(
+                inverse.reshape(-1),
+                weights=np.concatenate([i[1] for i in results])
+            ).astype(np.int64)
+            
+            observed, seg = np.unique(slots // 5, return_inverse=True)
+            counts = np.zeros((len(observed), 5), dtype=np.int64)
+            np.add.at(counts, (seg.reshape(-1), slots % 5), slot_counts)
+        
+        tensor = counts[:, 1:].reshape(-1, 2, 2)
+        
+        labels = mc.Transform.gen_segment_labels(
+            grpers=grpers,
+            uniques=uniques,
+            observed=observed
+        )
+        
+        tbls = {
+            mc.Transform._gen_label_key(label): tensor[i].tolist()
+            for i, label in enumerate(labels)
+        }
+        
+        return tbls
+    
+    def _prep_stream(
+        self,
+        prep: mc.Ingest
+    ) -> Tuple[DataFrame, List[float]]:
+        
+        """
+        Streams the input in chunks and accumulates the
+        tables without keeping the file in memory. The
+        returned df_prep is empty.
+        """
+        
+        tbls = mc.Transform.run_build_cont_tables_stream(
+            chunks=prep.run_stream(),
+            grpers=prep.grpers
+        )
+        
+        if prep.batch:
+            tbl: Dict[str, List[float]] = tbls
+        else:
+            tbl: List[float] = tbls.get(prep.grpers_val, [[0, 0], [0, 0]])
+        
+        return pd.DataFrame(), tbl
+    
     def analysis(
         self,
-        df_prep: DataFrame,
+        df_prep: Optional[DataFrame],
         tbl: List[float]
     ) -> DataFrame:
                      
@@ -63,6 +702,9 @@ class Model:
         """
         
         config = self.config
+        
+        if isinstance(tbl, dict):
+            return self._analysis_batch(df_prep, tbl)
 
         stats = mc.StatsTesting2x2Cont(
             config=config,
@@ -73,11 +715,84 @@ class Model:
         
         return df_result
     
+    def analysis_stratified(
+        self,
+        df_prep: Optional[DataFrame],
+        tbl: Dict[str, List[float]]
+    ) -> DataFrame:
+        
+        """
+        Runs the Cochran-Mantel-Haenszel test across the
+        batch mode tables, one stratum per analysis
+        group value.
+        """
+        
+        config = self.config
+        
+        tensor = np.array(list(tbl.values()), dtype=np.int64).reshape(-1, 2, 2)
+        
+        stats = mc.StatsTesting2x2Cont(
+            config=config,
+            tbl=tensor,
+            df=df_prep
+        )
+        df_result: DataFrame = stats.run_testing_stratified()
+        
+        return df_result
     
+    def _analysis_batch(
+        self,
+        df_prep: Optional[DataFrame],
+        tbls: Dict[str, List[float]]
+    ) -> DataFrame:
+        
+        """
+        Runs the testing for every analysis group value
+        in one batch, one row per value.
+        
+        Tables with an empty row or column cannot be
+        tested, their rows have nan stats and test
+        'untestable'.
+        """
+        
+        config = self.config
+        
+        labels = mc.Transform._gen_label_array(tbls)
+        tensor = np.array(list(tbls.values()), dtype=np.int64).reshape(-1, 2, 2)
+        
+        stats = mc.StatsTesting2x2Cont(
+            config=config,
+            tbl=tensor,
+            df=df_prep
+        )
+        df_result: DataFrame = stats.run_testing_batch(labels)
+        
+        return df_result
+    
+    def _gen_executor_config(
+        self
+    ) -> int:
+        
+        """
+        Unpacks the n_workers (default 1) of the
+        optional 'Executor' section, the process pool
+        of the batch mode counting, see
+        _prep_tables_pool. The section's chunk_size is
+        read by StatsTesting2x2Cont.
+        """
+        
+        executor_config = self.config.get("Executor") or {}
+        
+        n_workers = executor_config.get("n_workers", 1)
+        
+        if not isinstance(n_workers, int) or n_workers <= 0:
+            raise TypeError("Config file error: Expected 'n_workers' to be a positive 'int'.")
+        
+        return n_workers
+    
+
 if __name__ == "__main__":
     
     model = Model(config)
     
-    df_prep, tbl = model.prep()
-    
-    df_result = model.analysis(df_prep.copy(), tbl)
\ No newline at end of file
+    df_result = model.run()
\ No newline at end of file
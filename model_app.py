@@ -2,6 +2,7 @@ from typing import Any
 from pandas import DataFrame
 from typing import Dict
 from typing import List
+from typing import Optional
 from typing import Tuple
 
 import os
@@ -54,9 +55,35 @@ class Model:
         
         return df_prep, tbl
     
+    def prep_tables(
+        self
+    ) -> List[float]:
+        
+        """
+        Tables only alternative to prep, reduces the
+        input straight to the count table and frees
+        the harmonized DataFrame. Pass the result to
+        analysis with df_prep=None.
+        """
+        
+        df = self.df
+        config = self.config
+        
+        # ingest
+        prep = mc.Ingest(config)
+        df_prep: DataFrame = prep.run_harmonize(df)
+        
+        # transform
+        trans = mc.Transform(df=df_prep)
+        tbl: List[float] = trans.run_build_cont_table()
+        
+        del trans, df_prep
+        
+        return tbl
+    
     def analysis(
         self,
-        df_prep: DataFrame,
+        df_prep: Optional[DataFrame],
         tbl: List[float]
     ) -> DataFrame:
                      
@@ -82,6 +109,6 @@ if __name__ == "__main__":
     
     model = Model()
     
-    df_prep, tbl = model.prep()
+    tbl = model.prep_tables()
     
-    df_result = model.analysis(df_prep.copy(), tbl)
\ No newline at end of file
+    df_result = model.analysis(None, tbl)
\ No newline at end of file
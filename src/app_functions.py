@@ -15,17 +15,37 @@ def gen_card_2_results(
     four_fifths_test = df_results['four_fifths_test'].values[0]
     
     test_result = df_results['test_result'].values[0]
+    test = df_results['test'].values[0]
     pval = round(df_results['pvalue'].values[0],2)
     dof = round(df_results['dof'].values[0],2)
     statistic = round(df_results['statistic'].values[0],2)
     alpha = round(df_results['alpha'].values[0],2)
+    
+    test_desc = {
+        'chi2': 'Chi-square test',
+        'fisher': "Fisher's exact test",
+        'permutation': 'Permutation test',
+        'untestable': 'None'
+    }.get(test, test)
+    
+    # fisher reports the odds ratio and has no dof
+    if test == 'fisher':
+        stats_desc = f"odds ratio: {statistic}"
+    elif test == 'permutation':
+        stats_desc = f"statistic: {statistic}"
+    elif test == 'untestable':
+        stats_desc = ""
+    else:
+        stats_desc = f"""degrees of freedom: {dof}
+statistic: {statistic}"""
+    
     display_2a = f"""{four_fifths_test}
     
 {test_result}: 
+test: {test_desc}
 pvalue: {pval}
-degrees of freedom: {dof}
 alpha: {alpha}
-statistic: {statistic}"""
+{stats_desc}"""
         
     display_2b = df_results['result_desc'].values[0]
         
@@ -1,17 +1,51 @@
 from typing import Any
 from pandas import DataFrame
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Optional
 from typing import Tuple
+from typing import Union
 
 import pandas as pd
 import numpy as np
 import os
+import atexit
+import hashlib
+import json
+import pickle
+from collections import OrderedDict
 from scipy.stats import chi2_contingency
+from scipy.stats.contingency import expected_freq
+
+import src.model_functions as mf
 
 package_dir = os.path.dirname(os.path.abspath(__file__))
 main_dir = os.path.abspath(os.path.join(package_dir, ".."))
 
+# narrative templates, rendered with str.format
+narrative_templates: Dict[str, str] = {
+    "four_fifths_failed": "4/5ths Test failed at ratio of: {ratio}.",
+    "four_fifths_passed": "4/5ths Test passed at a ratio of: {ratio}.",
+    "four_fifths_error": "Error calculating 4/5 Test",
+    "diagonal": (
+        "The values on the positive diagonal of the 'tbl' indicate the distribution of {process} success across {group_variable} categories.\n\n"
+        "{group_other_val} had a higher proportion of successful outcomes compared to {group_target_val}.\n\n"
+        "Specifically, {percent_non_target_succ:.1f}% of {group_other_val} had success while only {percent_target_succ:.1f}%"
+        " of {group_target_val} had success.\n\n"
+        "This significant difference in {process} success rates suggests a potential {group_variable} bias, with {group_other_val} success in {process}"
+        " at a higher rate than {group_target_val}."
+    ),
+    "phi": "The phi correlation coefficient is {phi_corr_coeff:.3f}, indicating a {phi_bin} effect size. {diagonal_msg}",
+    "no_diagonal": "The diagonal values are not substantially higher, suggesting the relationship might be more nuanced.",
+    "result": (
+        "Testing for {grpers}: {grpers_val}, {four_fifths}\n\n"
+        "Based on the results of {test_desc}, there is {result} for {testing}-based {process} discrimination against {group_target_val} at the chosen significance level of {alpha}.\n\n"
+        "{phi_result}"
+    )
+}
+
 class Ingest:
     
     """
@@ -92,11 +126,28 @@ class Ingest:
             contains the contains the non-target 
             class value e.g. not-hired.
         :var grpers:
-            str, the analysis group
-            e.g. job_title.
+            Union[str, List[str]], the analysis group
+            e.g. job_title, or a list of columns e.g.
+            [job_title, region] in batch mode.
         :var grpers_val:
             str, the value of the analysis group,
-            e.g. analyst.
+            e.g. analyst. Optional, when omitted or
+            set to 'all' every value of grpers is
+            kept and tables are built per value.
+        :var batch:
+            bool, True when running in all-segments
+            batch mode.
+        :var chunksize:
+            Optional[int], number of rows read per chunk.
+            Optional, when set the file is streamed in
+            chunks of this size instead of loaded whole.
+        :var time_variable:
+            Optional[str], date column. Optional, when set
+            records are bucketed into periods, see
+            Transform.run_build_period_tensor.
+        :var time_period:
+            str, 'month' or 'quarter', the period length.
+            Optional, defaults to 'month'.
         """
         
         config = self.config
@@ -109,8 +160,12 @@ class Ingest:
             self.outcome_variable: str = config["Ingest"]["outcome_variable"]
             self.outcome_target_val: str = config["Ingest"]["outcome_target_val"]
             self.outcome_other_val: str = config["Ingest"]["outcome_other_val"]
-            self.grpers: str = config["Ingest"]["grpers"]
-            self.grpers_val: str = config["Ingest"]["grpers_val"]
+            self.grpers: Union[str, List[str]] = config["Ingest"]["grpers"]
+            self.grpers_val: str = config["Ingest"].get("grpers_val", "all")
+            self.batch: bool = self.grpers_val == "all"
+            self.chunksize: Optional[int] = config["Ingest"].get("chunksize")
+            self.time_variable: Optional[str] = config["Ingest"].get("time_variable")
+            self.time_period: str = config["Ingest"].get("time_period", "month")
 
             # Type validation
             if not isinstance(self.filepath, str):
@@ -127,36 +182,63 @@ class Ingest:
                 raise TypeError("Expected 'outcome_target_val' to be of type 'str'.")
             if not isinstance(self.outcome_other_val, str):
                 raise TypeError("Expected 'outcome_other_val' to be of type 'str'.")
-            if not isinstance(self.grpers, str):
-                raise TypeError("Expected 'grpers' to be of type 'str'.")
+            if not isinstance(self.grpers, str) and not (
+                isinstance(self.grpers, list) and all(
+                    isinstance(i, str) for i in self.grpers
+                )
+            ):
+                raise TypeError("Expected 'grpers' to be of type 'str' or a list of strings.")
             if not isinstance(self.grpers_val, str):
                 raise TypeError("Expected 'grpers_val' to be of type 'str'.")
+            if isinstance(self.grpers, list) and not self.batch:
+                raise ValueError("Expected 'grpers_val' to be 'all' when 'grpers' is a list.")
+            if self.chunksize is not None and (
+                not isinstance(self.chunksize, int) or self.chunksize <= 0
+            ):
+                raise TypeError("Expected 'chunksize' to be a positive 'int'.")
+            if self.time_variable is not None and not isinstance(self.time_variable, str):
+                raise TypeError("Expected 'time_variable' to be of type 'str'.")
+            if self.time_period not in ("month", "quarter"):
+                raise ValueError("Expected 'time_period' to be 'month' or 'quarter'.")
                 
         except KeyError as e:
             raise KeyError(f"Missing key '{e.args[0]}' in the config file. "
                            "Please ensure the config file contains all required keys under the 'Ingest' section: "
                            "'filepath', 'group_variable', 'group_target_val', 'group_other_val', "
-                           "'outcome_variable', 'outcome_target_val', 'outcome_other_val', 'grpers', and 'grpers_val'.")
+                           "'outcome_variable', 'outcome_target_val', 'outcome_other_val' and 'grpers'.")
 
         except TypeError as e:
             raise TypeError(f"Config file error: {e}")
         
     def run_load(
-        self
+        self,
+        usecols: Optional[List[str]] = None
     ) -> DataFrame:
         
         """
         Loads csv file. Assumes headers are row 0.
         
-        :param None:
+        Only the columns referenced by the config are
+        read and they are parsed as categoricals.
+        
+        :param usecols:
+            Optional[List[str]], columns to read instead
+            of the config ones, e.g. the union over the
+            variants of a sweep.
         :return DataFrame:
         """
         
         filepath = self.filepath
+        usecols = self._gen_usecols() if usecols is None else usecols
         csv_fp = os.path.join(main_dir, filepath)
 
         try:
-            return pd.read_csv(csv_fp, skiprows=0)
+            return pd.read_csv(
+                csv_fp, 
+                skiprows=0,
+                usecols=usecols,
+                dtype={col: 'category' for col in usecols}
+            )
 
         except FileNotFoundError:
             raise FileNotFoundError(
@@ -183,7 +265,119 @@ class Ingest:
             raise Exception(
                 f"An unexpected error occurred while loading the file: {str(e)}"
             )
+    
+    def run_stream(
+        self
+    ) -> Iterator[DataFrame]:
+        
+        """
+        Streams the csv file in chunks of chunksize rows,
+        yielding each chunk filtered and harmonized so
+        only one chunk is held in memory at a time.
+        
+        :param None:
+        :return Iterator[DataFrame]:
+            harmonized chunks.
+        """
+        
+        for df in self.run_load_chunks():
+            yield self.run_harmonize(df)
+    
+    def run_load_chunks(
+        self
+    ) -> Iterator[DataFrame]:
+        
+        """
+        Loads csv file in chunks of chunksize rows.
+        Assumes headers are row 0. Reads the same
+        columns and dtypes as run_load.
+        
+        :param None:
+        :return Iterator[DataFrame]:
+        """
+        
+        filepath = self.filepath
+        chunksize = self.chunksize
+        usecols = self._gen_usecols()
+        csv_fp = os.path.join(main_dir, filepath)
+
+        try:
+            with pd.read_csv(
+                csv_fp, 
+                skiprows=0, 
+                usecols=usecols,
+                dtype={col: 'category' for col in usecols},
+                chunksize=chunksize
+            ) as reader:
+                for df in reader:
+                    yield df
+
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"The file at {csv_fp} was not found. Please check the file path."
+            )
+
+        except pd.errors.EmptyDataError:
+            raise ValueError(
+                f"The file at {csv_fp} is empty and cannot be loaded."
+            )
+
+        except pd.errors.ParserError:
+            raise ValueError(
+                f"The file at {csv_fp} contains malformed data and could not be parsed as a valid CSV."
+            )
+
+        except PermissionError:
+            raise PermissionError(
+                f"Permission denied when attempting to read the file at {csv_fp}."
+                f"Please check the file permissions."
+            )
+        
+    def _gen_usecols(
+        self
+    ) -> List[str]:
+        
+        """
+        Method to list the columns the pipeline reads,
+        taken from the validated config keys.
+        
+        :param None:
+        :return usecols:
+            List[str], unique column names in config order.
+        """
+        
+        cols = [
+            self.group_variable,
+            self.outcome_variable,
+            *self._gen_grpers_cols(self.grpers)
+        ]
+        
+        if self.time_variable is not None:
+            cols.append(self.time_variable)
+        
+        usecols = list(dict.fromkeys(cols))
+        
+        return usecols
+    
+    @staticmethod
+    def _gen_grpers_cols(
+        grpers: Union[str, List[str]]
+    ) -> List[str]:
         
+        """
+        Method to normalize the analysis group to a
+        list of column names.
+        
+        :param grpers:
+            Union[str, List[str]], the analysis group.
+        :return cols:
+            List[str], analysis group columns.
+        """
+        
+        cols = [grpers] if isinstance(grpers, str) else list(grpers)
+        
+        return cols
+    
     def run_harmonize(
         self,
         df: DataFrame
@@ -196,7 +390,7 @@ class Ingest:
             DataFrame, loaded df
         :return df:
             DataFrame, filtered down to target and other group and
-            harmonize the fields
+            harmonize the fields, see _apply_harmonize
         """
     
         group_variable = self.group_variable
@@ -224,7 +418,8 @@ class Ingest:
             group_other_val=group_other_val,
             outcome_variable=outcome_variable,
             outcome_target_val=outcome_target_val,
-            outcome_other_val=outcome_other_val
+            outcome_other_val=outcome_other_val,
+            grpers=grpers
         )
       
         return df
@@ -256,23 +451,23 @@ class Ingest:
         :param grpers:
             str, the name of the analysis group.
         :param grpers_val:
-            str, the value of the analysis group.
+            str, the value of the analysis group,
+            'all' keeps every value.
         :return df:
             DataFrame, filtered df
         """
                 
-        df = df.loc[
-            df[group_variable].isin(
-                [
-                    group_target_val, 
-                    group_other_val
-                ]
-            )
-        ]  
+        mask = df[group_variable].isin(
+            [
+                group_target_val, 
+                group_other_val
+            ]
+        )
             
-        df = df.loc[
-            df[grpers]==grpers_val
-        ]
+        if grpers_val != "all":
+            mask &= df[grpers]==grpers_val
+            
+        df = df.loc[mask]
             
         return df
     
@@ -284,7 +479,8 @@ class Ingest:
         group_other_val: str,
         outcome_variable: str,
         outcome_target_val: str,
-        outcome_other_val: str
+        outcome_other_val: str,
+        grpers: Union[str, List[str]]
     ) -> DataFrame:
         
         """
@@ -308,33 +504,125 @@ class Ingest:
             aka success
         :param outcome_other_val:
             str, class nontarget value of the outcome_variable
+        :param grpers:
+            Union[str, List[str]], the analysis group.
         :return df:
-            DataFrame, target df
+            DataFrame, compact df with the grpers columns and
+            the int8 group_var_clean and outcome_var_clean
+            columns.
         """
         
         # harmonize the group target
-        df['group_var_clean'] = np.where(
-            df[group_variable]==group_target_val, 
-            1,
-            np.where(
-                df[group_variable]==group_other_val, 
-                0, 
-                -1
-            )
+        group_var_clean = self._gen_codes(
+            sr=df[group_variable],
+            target_val=group_target_val,
+            other_val=group_other_val
         )
         
         # harmonize the outcome target
-        df['outcome_var_clean'] = np.where(
-            df[outcome_variable]==outcome_target_val, 
-            1,  
-            np.where(
-                df[self.outcome_variable]==outcome_other_val,
-                0, 
-                -1
+        outcome_var_clean = self._gen_codes(
+            sr=df[outcome_variable],
+            target_val=outcome_target_val,
+            other_val=outcome_other_val
+        )
+        
+        df_clean = pd.DataFrame(
+            {
+                **{col: df[col] for col in self._gen_grpers_cols(grpers)},
+                'group_var_clean': group_var_clean,
+                'outcome_var_clean': outcome_var_clean
+            },
+            index=df.index
+        )
+        
+        if self.time_variable is not None:
+            df_clean['period'] = self._gen_periods(
+                sr=df[self.time_variable],
+                time_period=self.time_period
             )
-        )  
         
-        return df
+        return df_clean
+    
+    def _gen_periods(
+        self,
+        sr: pd.Series,
+        time_period: str
+    ) -> pd.arrays.PeriodArray:
+        
+        """
+        Method to bucket a date column into periods.
+        
+        Parses the categories only and gathers them by
+        code, as _gen_codes does. Unparsable or missing
+        dates get NaT.
+        
+        :param sr:
+            pd.Series, date column.
+        :param time_period:
+            str, 'month' or 'quarter'.
+        :return periods:
+            pd.arrays.PeriodArray, period of every row.
+        """
+        
+        freq = {"month": "M", "quarter": "Q"}[time_period]
+        
+        sr = sr.astype('category')
+        
+        dates = pd.to_datetime(
+            pd.Series(sr.cat.categories.astype(str)), 
+            format="mixed", 
+            errors="coerce"
+        )
+        
+        # last slot catches the -1 code of missing values
+        lookup = pd.PeriodIndex(dates.dt.to_period(freq)).append(
+            pd.PeriodIndex([pd.NaT], freq=freq)
+        )
+        
+        periods = lookup[sr.cat.codes.to_numpy()].array
+        
+        return periods
+    
+    def _gen_codes(
+        self,
+        sr: pd.Series,
+        target_val: str,
+        other_val: str
+    ) -> np.ndarray:
+        
+        """
+        Method to encode a column to int8 codes,
+        1 for the target value, 0 for the other
+        value and -1 for anything else.
+        
+        Maps the categorical codes through a lookup
+        sized to the categories, so the per-row work
+        is a single gather.
+        
+        :param sr:
+            pd.Series, column to encode.
+        :param target_val:
+            str, value encoded as 1.
+        :param other_val:
+            str, value encoded as 0.
+        :return codes:
+            np.ndarray, int8 codes.
+        """
+        
+        sr = sr.astype('category')
+        cats = sr.cat.categories
+        
+        # last slot catches the -1 code of missing values
+        lookup = np.full(len(cats) + 1, -1, dtype=np.int8)
+        
+        if other_val in cats:
+            lookup[cats.get_loc(other_val)] = 0
+        if target_val in cats:
+            lookup[cats.get_loc(target_val)] = 1
+        
+        codes = lookup[sr.cat.codes.to_numpy()]
+        
+        return codes
     
     
 class Transform:
@@ -373,153 +661,1502 @@ class Transform:
             List[int], filtered down to target and other group.
         """
         
+        tbl = self.run_count_cont_table().tolist()
+                    
+        return tbl
+    
+    def run_count_cont_table(
+        self
+    ) -> np.ndarray:
+        
+        """
+        Function to count the contingency table with a
+        single bincount over a flat cell index.
+        
+        Uses the run_build_cont_table layout. Rows whose
+        group or outcome is not harmonized (-1) are not
+        counted and empty cells stay 0, so the result is
+        always 2x2.
+        
+        :return tbl:
+            np.ndarray, int64 array of shape (2, 2).
+        """
+        
         df = self.df
         
-        cols = [
-            'group_var_clean', 
-            'outcome_var_clean'
-        ]
+        cell = self._gen_cell_index(
+            group=df['group_var_clean'].to_numpy(),
+            outcome=df['outcome_var_clean'].to_numpy()
+        )
         
-        df = df[cols]
-        
-        tbl = (
-            df.pivot_table(
-                index='group_var_clean',
-                columns='outcome_var_clean', 
-                aggfunc=len
-            ).
-            sort_index(
-                axis=1, 
-                ascending=True
-            ).
-            sort_index(ascending=False). # ensure always [1,0]
-            values.tolist()
-        ) 
-                    
-        return tbl
+        tbl = np.bincount(
+            cell[cell >= 0], 
+            minlength=4
+        ).astype(np.int64).reshape(2, 2)
         
-class StatsTesting2x2Cont:
+        return tbl
     
-    """
-    Class to perform 2x2 Contigency Table analysis
-    with Chi2 and Phi Correlation Coefficent Testing.
-
-    Provides context into potential association between
-    variables and the strength of the association.
-    """
+    def _gen_cell_index(
+        self,
+        group: np.ndarray,
+        outcome: np.ndarray
+    ) -> np.ndarray:
+        
+        """
+        Method to map harmonized codes to the flat
+        cell index of the 2x2 table.
+        
+        Target group (1) maps to row 0 and success (1)
+        to column 1, i.e. index = (1 - group) * 2 + outcome.
+        
+        :param group:
+            np.ndarray, group_var_clean codes.
+        :param outcome:
+            np.ndarray, outcome_var_clean codes.
+        :return cell:
+            np.ndarray, int64 cell index in [0, 3],
+            -1 where either code is -1.
+        """
+        
+        cell = mf.gen_cell_index_2x2(
+            group=group,
+            outcome=outcome
+        )
+        
+        return cell
     
-    def __init__(
+    def run_build_cont_tables(
         self,
-        config: Dict[Any, Any],
-        tbl: List[int],
-        df: DataFrame
-    ) -> None:
+        grpers: Union[str, List[str]]
+    ) -> Dict[Union[str, Tuple[str, ...]], List[int]]:
         
         """
-        Inits the class variables and unpacks the
-        config variables.
+        Function to generate a contingency table for
+        every value of the analysis group in a single
+        grouped count, see run_build_cont_tensor.
         
-        :param config:
-            Dict[str,Any], loaded config file.
-        :param tbl:
-            List[int], 2x2 cont table.
-        :param df:
-            DataFrame, original input DataFrame.
+        :param grpers:
+            Union[str, List[str]], the analysis group.
+        :return tbls:
+            Dict[Union[str, Tuple[str, ...]], List[int]],
+            2x2 cont table keyed by the analysis group
+            value, a tuple of values for several columns.
         """
         
-        self.config = config
-        self.tbl = tbl
-        self.df = df
-
-        self.unpack_config()
-
-    def run_testing(
-        self
-    ) -> DataFrame:
+        labels, tensor = self.run_build_cont_tensor(grpers=grpers)
+        
+        tbls = {
+            self._gen_label_key(label): tensor[i].tolist()
+            for i, label in enumerate(labels)
+        }
+        
+        return tbls
+    
+    def run_build_cont_tensor(
+        self,
+        grpers: Union[str, List[str]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
         
         """
-        Run function for the class.
+        Function to generate the contingency tables of
+        every segment of the analysis group as one
+        (n_segments, 2, 2) array.
         
-        Runs hypothesis evaluation and builds
-        the output report DataFrame.
+        Segments are numbered with one groupby and all
+        cells are counted with a single bincount over
+        segment * 4 + cell. Tables use the
+        run_build_cont_table layout.
         
-        :param None:
-        :return df_results:
-            DataFrame, with testing results.
+        :param grpers:
+            Union[str, List[str]], the analysis group,
+            one column or several.
+        :return (labels, tensor):
+            Tuple[np.ndarray, np.ndarray], segment labels
+            (tuples when grpers is a list) and the int64
+            counts of shape (n_segments, 2, 2) in label order.
         """
         
-        alpha = self.alpha
-        tbl = self.tbl
-        process = self.process
-        group_variable = self.group_variable
-        group_target_val = self.group_target_val
-        group_other_val = self.group_other_val
-        bin_edges = self.bin_edges
-        bin_labels = self.bin_labels
-                
-        res = self.gen_hypothesis_eval(tbl)
-
-        df_results = self.run_report_bld(
-            alpha=alpha,
-            res=res,
-            tbl=tbl,
-            process=process,
-            group_variable=group_variable,
-            group_target_val=group_target_val,
-            group_other_val=group_other_val,
-            bin_edges=bin_edges,
-            bin_labels=bin_labels
+        labels, seg, cell = self.run_build_segment_index(grpers=grpers)
+        n_segments = len(labels)
+        
+        valid = (seg >= 0) & (cell >= 0)
+        
+        tensor = np.bincount(
+            seg[valid] * 4 + cell[valid],
+            minlength=n_segments * 4
+        ).astype(np.int64).reshape(n_segments, 2, 2)
+        
+        return labels, tensor
+    
+    def run_build_segment_index(
+        self,
+        grpers: Union[str, List[str]]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        
+        """
+        Function to number the segments of the analysis
+        group and index the table cell of every row, see
+        run_build_cont_tensor.
+        
+        :param grpers:
+            Union[str, List[str]], the analysis group,
+            one column or several.
+        :return (labels, seg, cell):
+            Tuple[np.ndarray, np.ndarray, np.ndarray], sorted
+            segment labels, the int64 segment number of
+            every row and its int64 cell index, both -1
+            where not counted.
+        """
+        
+        df = self.df
+        
+        codes, uniques = self.gen_grpers_codes(grpers=grpers)
+        sizes = [max(len(i), 1) for i in uniques]
+        
+        flat = mf.gen_segment_codes(codes, sizes)
+        
+        missing = flat < 0
+        observed_flat = flat[~missing]
+        n_flat = int(np.prod(sizes, dtype=np.float64))
+        
+        # number the observed segments in sorted code order
+        if n_flat <= 4 * len(df) + 1024:
+            observed = np.flatnonzero(np.bincount(observed_flat, minlength=n_flat))
+            lookup = np.full(n_flat, -1, dtype=np.int64)
+            lookup[observed] = np.arange(len(observed))
+            seg_observed = lookup[observed_flat]
+        else:
+            observed, seg_observed = np.unique(observed_flat, return_inverse=True)
+        
+        seg = np.full(len(df), -1, dtype=np.int64)
+        seg[~missing] = seg_observed.reshape(-1)
+        
+        labels = self.gen_segment_labels(
+            grpers=grpers,
+            uniques=uniques,
+            observed=observed
         )
         
-        return df_results
+        cell = self._gen_cell_index(
+            group=df['group_var_clean'].to_numpy(),
+            outcome=df['outcome_var_clean'].to_numpy()
+        )
+        
+        return labels, seg, cell
     
-    def unpack_config(
-        self
-    ) -> None:
+    def gen_grpers_codes(
+        self,
+        grpers: Union[str, List[str]]
+    ) -> Tuple[List[np.ndarray], List[pd.Index]]:
         
         """
-        Function to unpack config variables.
+        Function to get the codes of every analysis
+        group column, the categorical codes as stored
+        and sorted factorized codes for other dtypes.
         
-        :param None:
-        :return None:
+        :param grpers:
+            Union[str, List[str]], the analysis group.
+        :return (codes, uniques):
+            Tuple[List[np.ndarray], List[pd.Index]], the
+            codes of every column, -1 for a missing
+            value, and the values they stand for.
         """
         
-        config = self.config
-
-        try:
-            self.alpha: float = config["StatsTesting2x2Cont"]["alpha"]
-            self.group_variable: str = config["Ingest"]["group_variable"]
-            self.group_target_val: str = config["Ingest"]["group_target_val"]
-            self.group_other_val: str = config["Ingest"]["group_other_val"]
-            self.outcome_variable: str = config["Ingest"]["outcome_variable"]
-            self.outcome_target_val: str = config["Ingest"]["outcome_target_val"]
-            self.outcome_other_val: str = config["Ingest"]["outcome_other_val"]
-            self.grpers: str = config["Ingest"]["grpers"]
-            self.grpers_val: str = config["Ingest"]["grpers_val"]
+        df = self.df
+        
+        cols = [grpers] if isinstance(grpers, str) else list(grpers)
+        
+        codes = []
+        uniques = []
+        
+        for col in cols:
+            sr = df[col]
             
-            self.testing: str = config["StatsTesting2x2Cont"]["testing"]
-            self.process: str = config["StatsTesting2x2Cont"]["process"]
-            self.bin_edges: List[float] = config["StatsTesting2x2Cont"]["phi_bin_edges"]
-            self.bin_labels: List[str] = config["StatsTesting2x2Cont"]["phi_bin_labels"]
-
-            if not isinstance(self.alpha, float):
-                raise TypeError("Expected 'alpha' to be of type 'float'.")
-            if not isinstance(self.group_variable, str):
-                raise TypeError("Expected 'group_variable' to be of type 'str'.")
-            if not isinstance(self.group_target_val, str):
-                raise TypeError("Expected 'group_target_val' to be of type 'str'.")
-            if not isinstance(self.group_other_val, str):
-                raise TypeError("Expected 'group_other_val' to be of type 'str'.")
-            if not isinstance(self.outcome_variable, str):
-                raise TypeError("Expected 'outcome_variable' to be of type 'str'.")
-            if not isinstance(self.outcome_target_val, str):
-                raise TypeError("Expected 'outcome_target_val' to be of type 'str'.")
+            if isinstance(sr.dtype, pd.CategoricalDtype):
+                codes.append(sr.cat.codes.to_numpy())
+                uniques.append(sr.cat.categories)
+            else:
+                col_codes, col_uniques = pd.factorize(sr, sort=True)
+                codes.append(col_codes)
+                uniques.append(pd.Index(col_uniques))
+        
+        return codes, uniques
+    
+    @classmethod
+    def gen_segment_labels(
+        cls,
+        grpers: Union[str, List[str]],
+        uniques: List[pd.Index],
+        observed: np.ndarray
+    ) -> np.ndarray:
+        
+        """
+        Function to decode combined segment codes,
+        see model_functions.gen_segment_codes, into
+        segment labels.
+        
+        :param grpers:
+            Union[str, List[str]], the analysis group.
+        :param uniques:
+            List[pd.Index], values of every column, see
+            gen_grpers_codes.
+        :param observed:
+            np.ndarray, combined codes.
+        :return labels:
+            np.ndarray, segment values, tuples of values
+            for several columns.
+        """
+        
+        sizes = [max(len(i), 1) for i in uniques]
+        
+        digits = []
+        
+        for size in reversed(sizes):
+            observed, digit = np.divmod(observed, size)
+            digits.append(digit)
+            
+        digits = digits[::-1]
+        
+        values = [
+            col_uniques.take(digit).tolist() 
+            for col_uniques, digit in zip(uniques, digits)
+        ]
+        
+        if isinstance(grpers, str):
+            labels = cls._gen_label_array(values[0])
+        else:
+            labels = cls._gen_label_array(list(zip(*values)))
+            
+        return labels
+    
+    def run_build_period_tensor(
+        self,
+        grpers: Union[str, List[str]]
+    ) -> Tuple[pd.PeriodIndex, np.ndarray, np.ndarray]:
+        
+        """
+        Function to generate the contingency tables of
+        every segment in every period as one
+        (n_periods, n_segments, 2, 2) array, counted with
+        a single bincount over
+        (period * n_segments + segment) * 4 + cell.
+        
+        Periods run from the first to the last dated
+        record with no gaps, so rolling windows over the
+        first axis span calendar periods, see
+        model_functions.gen_rolling_tables. Records with
+        no date are not counted.
+        
+        Expects the period column of Ingest, set with
+        the time_variable config key.
+        
+        :param grpers:
+            Union[str, List[str]], the analysis group.
+        :return (periods, labels, tensor):
+            Tuple[pd.PeriodIndex, np.ndarray, np.ndarray],
+            the periods, the segment labels and the int64
+            counts.
+        """
+        
+        df = self.df
+        
+        if 'period' not in df:
+            raise KeyError(
+                "Missing column 'period', set 'time_variable' in the 'Ingest' section."
+            )
+        
+        labels, seg, cell = self.run_build_segment_index(grpers=grpers)
+        n_segments = len(labels)
+        
+        period = df['period'].array
+        dated = ~period.isna()
+        
+        if not dated.any():
+            periods = pd.PeriodIndex([], freq=period.freq)
+            return periods, labels, np.zeros((0, n_segments, 2, 2), dtype=np.int64)
+        
+        ordinal = period.asi8
+        first = ordinal[dated].min()
+        
+        periods = pd.period_range(
+            start=pd.Period(ordinal=int(first), freq=period.freq),
+            end=pd.Period(ordinal=int(ordinal[dated].max()), freq=period.freq)
+        )
+        n_periods = len(periods)
+        
+        valid = dated & (seg >= 0) & (cell >= 0)
+        
+        index = ((ordinal[valid] - first) * n_segments + seg[valid]) * 4 + cell[valid]
+        
+        tensor = np.bincount(
+            index,
+            minlength=n_periods * n_segments * 4
+        ).astype(np.int64).reshape(n_periods, n_segments, 2, 2)
+        
+        return periods, labels, tensor
+    
+    @staticmethod
+    def run_save_period_tensor(
+        filepath: str,
+        periods: pd.PeriodIndex,
+        labels: np.ndarray,
+        tensor: np.ndarray
+    ) -> None:
+        
+        """
+        Saves a run_build_period_tensor result, the
+        tensor as a .npy file that np.load can memory
+        map and the periods and segment keys in a json
+        file next to it.
+        
+        :param filepath:
+            str, .npy path relative to the main dir, the
+            extension is added when missing and the
+            directory created.
+        :param periods, labels, tensor:
+            see run_build_period_tensor.
+        """
+        
+        fp = Transform._gen_npy_path(filepath)
+        
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        
+        np.save(fp, np.ascontiguousarray(tensor, dtype=np.int64))
+        
+        index = {
+            "freq": periods.freqstr,
+            "periods": [str(i) for i in periods],
+            "labels": [
+                list(key) if isinstance(key, tuple) else key
+                for key in map(Transform._gen_label_key, labels)
+            ]
+        }
+        
+        with open(f"{os.path.splitext(fp)[0]}.json", "w") as f:
+            json.dump(index, f)
+    
+    @staticmethod
+    def run_load_period_tensor(
+        filepath: str,
+        mmap_mode: Optional[str] = "r"
+    ) -> Tuple[pd.PeriodIndex, np.ndarray, np.ndarray]:
+        
+        """
+        Loads a tensor saved by run_save_period_tensor.
+        
+        :param filepath:
+            str, .npy path relative to the main dir, the
+            extension is added when missing.
+        :param mmap_mode:
+            Optional[str], np.load mmap_mode, None
+            reads the tensor into memory.
+        :return (periods, labels, tensor):
+            Tuple[pd.PeriodIndex, np.ndarray, np.ndarray],
+            labels are the segment keys.
+        """
+        
+        fp = Transform._gen_npy_path(filepath)
+        
+        with open(f"{os.path.splitext(fp)[0]}.json") as f:
+            index = json.load(f)
+        
+        periods = pd.PeriodIndex(index["periods"], freq=index["freq"])
+        labels = Transform._gen_label_array([
+            tuple(i) if isinstance(i, list) else i
+            for i in index["labels"]
+        ])
+        tensor = np.load(fp, mmap_mode=mmap_mode)
+        
+        return periods, labels, tensor
+    
+    @staticmethod
+    def _gen_npy_path(
+        filepath: str
+    ) -> str:
+        
+        """
+        Method to resolve a period tensor path against
+        the main dir, with the .npy extension np.save
+        would add.
+        """
+        
+        fp = os.path.join(main_dir, filepath)
+        
+        if not fp.endswith(".npy"):
+            fp = f"{fp}.npy"
+            
+        return fp
+    
+    @staticmethod
+    def _gen_label_key(
+        label: Any
+    ) -> Union[str, Tuple[str, ...]]:
+        
+        """
+        Method to turn a segment label into its
+        key, a tuple of strings for several columns
+        so that values containing ', ' stay distinct.
+        
+        :param label:
+            Any, segment value or tuple of values.
+        :return key:
+            Union[str, Tuple[str, ...]], segment key.
+        """
+        
+        if isinstance(label, tuple):
+            return tuple(str(i) for i in label)
+        
+        return str(label)
+    
+    @staticmethod
+    def _gen_label_desc(
+        label: Any
+    ) -> str:
+        
+        """
+        Method to turn a segment label into the
+        grpers_val shown in reports, the values of
+        several columns joined with ', '.
+        """
+        
+        if isinstance(label, tuple):
+            return ", ".join(str(i) for i in label)
+        
+        return str(label)
+    
+    @staticmethod
+    def _gen_label_array(
+        labels: Iterable[Any]
+    ) -> np.ndarray:
+        
+        """
+        Method to put segment labels in a 1d object
+        array, without numpy unpacking tuple labels
+        into a second axis.
+        """
+        
+        labels = list(labels)
+        arr = np.empty(len(labels), dtype=object)
+        
+        for i, label in enumerate(labels):
+            arr[i] = label
+            
+        return arr
+    
+    @classmethod
+    def run_build_cont_tables_stream(
+        cls,
+        chunks: Iterable[DataFrame],
+        grpers: Union[str, List[str]]
+    ) -> Dict[str, List[int]]:
+        
+        """
+        Function to accumulate contingency tables over
+        harmonized chunks. Each chunk is reduced to its
+        per-value counts and added to running int64
+        totals, so no chunk is kept after counting.
+        
+        :param chunks:
+            Iterable[DataFrame], harmonized chunks, e.g.
+            from Ingest.run_stream.
+        :param grpers:
+            Union[str, List[str]], the analysis group.
+        :return tbls:
+            Dict[str, List[int]], 2x2 cont table
+            keyed by the analysis group value.
+        """
+        
+        totals: Dict[str, np.ndarray] = {}
+        
+        for df in chunks:
+            tbls = cls(df=df).run_build_cont_tables(grpers=grpers)
+            
+            for seg, tbl in tbls.items():
+                if seg not in totals:
+                    totals[seg] = np.zeros((2, 2), dtype=np.int64)
+                totals[seg] += tbl
+        
+        tbls = {
+            seg: totals[seg].tolist()
+            for seg in sorted(totals)
+        }
+        
+        return tbls
+        
+class CountPartial:
+    
+    """
+    Mergeable partial count tables, the segment keys
+    and their int64 2x2 counts, e.g. one per node of
+    a sharded run.
+    
+    Merging sums the counts by key, so it is
+    associative and commutative and partials can be
+    combined in any order. The meta fields must match
+    for two partials to merge.
+    
+    Saved as a compressed .npz file holding the format version,
+    the json meta, the json encoded keys and the (N, 2, 2) counts.
+    """
+    
+    format_version: int = 2
+    
+    # config fields the counts depend on
+    meta_keys: List[str] = [
+        'group_variable',
+        'group_target_val',
+        'group_other_val',
+        'outcome_variable',
+        'outcome_target_val',
+        'outcome_other_val',
+        'grpers'
+    ]
+    
+    def __init__(
+        self,
+        keys: List[str],
+        counts: np.ndarray,
+        meta: Dict[str, Any]
+    ) -> None:
+        
+        """
+        :param keys:
+            List[str], unique segment keys, tuples of
+            strings for several grpers columns.
+        :param counts:
+            np.ndarray, int64 counts of shape
+            (len(keys), 2, 2) in key order.
+        :param meta:
+            Dict[str, Any], the meta_keys values of the
+            producing Ingest config.
+        """
+        
+        counts = np.asarray(counts, dtype=np.int64).reshape(-1, 2, 2)
+        
+        if len(keys) != len(counts):
+            raise ValueError("Expected one 2x2 count table per key.")
+        if len(set(keys)) != len(keys):
+            raise ValueError("Expected unique keys.")
+        
+        self.keys = list(keys)
+        self.counts = counts
+        self.meta = meta
+    
+    @classmethod
+    def from_tables(
+        cls,
+        tbls: Dict[str, List[int]],
+        prep: Ingest
+    ) -> "CountPartial":
+        
+        """
+        Builds a partial from the tables of a
+        Transform run.
+        
+        :param tbls:
+            Dict[str, List[int]], 2x2 cont table keyed
+            by the analysis group value.
+        :param prep:
+            Ingest, the Ingest the tables came from.
+        :return partial:
+            CountPartial
+        """
+        
+        meta = {i: getattr(prep, i) for i in cls.meta_keys}
+        
+        partial = cls(
+            keys=list(tbls),
+            counts=np.array(list(tbls.values()), dtype=np.int64),
+            meta=meta
+        )
+        
+        return partial
+    
+    def to_tables(
+        self
+    ) -> Dict[str, List[int]]:
+        
+        """
+        Returns the counts as tables keyed by
+        segment, in sorted key order.
+        """
+        
+        order = sorted(range(len(self.keys)), key=self.keys.__getitem__)
+        
+        tbls = {
+            self.keys[i]: self.counts[i].tolist()
+            for i in order
+        }
+        
+        return tbls
+    
+    def merge(
+        self,
+        other: "CountPartial",
+        sign: int = 1
+    ) -> "CountPartial":
+        
+        """
+        Returns a new partial with the counts of both
+        summed by key.
+        
+        :param other:
+            CountPartial, partial with the same meta.
+        :param sign:
+            int, -1 subtracts the other counts instead,
+            e.g. to retract corrected records.
+        :return partial:
+            CountPartial
+        """
+        
+        if self.meta != other.meta:
+            raise ValueError(
+                f"Cannot merge partials with different meta: {self.meta} and {other.meta}."
+            )
+        
+        keys = sorted(set(self.keys) | set(other.keys))
+        index = {key: i for i, key in enumerate(keys)}
+        
+        counts = np.zeros((len(keys), 2, 2), dtype=np.int64)
+        
+        for partial, mult in ((self, 1), (other, sign)):
+            pos = np.array([index[key] for key in partial.keys], dtype=np.int64)
+            np.add.at(counts, pos, mult * partial.counts)
+        
+        negative = (counts < 0).any(axis=(1, 2))
+        
+        if negative.any():
+            raise ValueError(
+                f"Retractions exceed the counts of keys: {np.array(keys)[negative].tolist()}."
+            )
+        
+        partial = CountPartial(
+            keys=keys,
+            counts=counts,
+            meta=dict(self.meta)
+        )
+        
+        return partial
+    
+    @classmethod
+    def merge_all(
+        cls,
+        partials: Iterable["CountPartial"]
+    ) -> "CountPartial":
+        
+        """
+        Merges any number of partials, see merge.
+        """
+        
+        partials = list(partials)
+        
+        if not partials:
+            raise ValueError("Expected at least one partial to merge.")
+        
+        merged = partials[0]
+        
+        for partial in partials[1:]:
+            merged = merged.merge(partial)
+            
+        return merged
+    
+    def gen_changed_keys(
+        self,
+        other: "CountPartial"
+    ) -> List[str]:
+        
+        """
+        Returns the keys whose counts differ from
+        other's, missing keys count as zeros.
+        
+        :param other:
+            CountPartial, e.g. the state before an update.
+        :return keys:
+            List[str], changed keys in sorted order.
+        """
+        
+        zeros = np.zeros((2, 2), dtype=np.int64)
+        
+        tbls = dict(zip(self.keys, self.counts))
+        tbls_other = dict(zip(other.keys, other.counts))
+        
+        keys = [
+            key for key in sorted(set(tbls) | set(tbls_other))
+            if not np.array_equal(tbls.get(key, zeros), tbls_other.get(key, zeros))
+        ]
+        
+        return keys
+    
+    def save(
+        self,
+        filepath: str
+    ) -> None:
+        
+        """
+        Saves the partial to a .npz file, relative
+        to the main dir, see
+        model_functions.run_atomic_write.
+        """
+        
+        fp = os.path.join(main_dir, filepath)
+        
+        mf.run_atomic_write(
+            fp,
+            lambda f: np.savez_compressed(
+                f,
+                format_version=np.int64(self.format_version),
+                meta=np.array(json.dumps(self.meta, sort_keys=True)),
+                keys=np.array([json.dumps(i) for i in self.keys], dtype=np.str_),
+                counts=self.counts
+            )
+        )
+    
+    @classmethod
+    def load(
+        cls,
+        filepath: str
+    ) -> "CountPartial":
+        
+        """
+        Loads a partial saved by save.
+        
+        :param filepath:
+            str, .npz file relative to the main dir.
+        :return partial:
+            CountPartial
+        """
+        
+        fp = os.path.join(main_dir, filepath)
+        
+        with np.load(fp, allow_pickle=False) as f:
+            format_version = int(f["format_version"])
+            
+            if format_version != cls.format_version:
+                raise ValueError(
+                    f"The partial at {fp} has format version {format_version}, "
+                    f"expected {cls.format_version}."
+                )
+            
+            partial = cls(
+                keys=[
+                    tuple(key) if isinstance(key, list) else key
+                    for key in map(json.loads, f["keys"].tolist())
+                ],
+                counts=f["counts"],
+                meta=json.loads(str(f["meta"]))
+            )
+        
+        return partial
+    
+    
+class StatsCache:
+    
+    """
+    Bounded LRU cache of hypothesis results keyed
+    by the table counts and the test options.
+    
+    Instances are shared per (maxsize, path), so
+    results carry over between StatsTesting2x2Cont
+    runs in a process. With a path the cache is
+    loaded from disk on creation and saved at exit.
+    
+    Only the single table gen_hypothesis_eval path
+    is cached, the vectorized batch kernel is faster
+    than the lookups.
+    """
+    
+    # bump when a code change alters the results
+    cache_version: int = 3
+    
+    instances: Dict[Tuple[int, Optional[str]], "StatsCache"] = {}
+    
+    def __init__(
+        self,
+        maxsize: int = 100000,
+        path: Optional[str] = None
+    ) -> None:
+        
+        """
+        :param maxsize:
+            int, max number of entries.
+        :param path:
+            Optional[str], pickle file relative to the
+            main dir, None keeps the cache in memory.
+        """
+        
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.entries: OrderedDict = OrderedDict()
+        
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.join(main_dir, path)), exist_ok=True)
+            
+            self.load()
+            atexit.register(self.save)
+    
+    @classmethod
+    def get_instance(
+        cls,
+        maxsize: int = 100000,
+        path: Optional[str] = None
+    ) -> "StatsCache":
+        
+        """
+        Returns the shared cache for these settings.
+        """
+        
+        key = (maxsize, path)
+        
+        if key not in cls.instances:
+            cls.instances[key] = cls(maxsize=maxsize, path=path)
+            
+        return cls.instances[key]
+    
+    def get(
+        self,
+        key: Tuple[Any, ...]
+    ) -> Optional[Any]:
+        
+        """
+        Returns the cached value or None, counting
+        the hit or miss.
+        """
+        
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        
+        self.misses += 1
+        return None
+    
+    def put(
+        self,
+        key: Tuple[Any, ...],
+        value: Any
+    ) -> None:
+        
+        """
+        Stores a value, evicting the least recently
+        used entry when full.
+        """
+        
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+    
+    def cache_info(
+        self
+    ) -> Dict[str, int]:
+        
+        """
+        Returns the hit, miss and size counters.
+        """
+        
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "maxsize": self.maxsize,
+            "currsize": len(self.entries)
+        }
+    
+    def load(
+        self
+    ) -> None:
+        
+        """
+        Loads the entries saved at path, if any. A
+        file saved with another cache_version is
+        ignored.
+        """
+        
+        fp = os.path.join(main_dir, self.path)
+        
+        if os.path.exists(fp):
+            with open(fp, "rb") as f:
+                saved = pickle.load(f)
+            
+            if isinstance(saved, dict) and saved.get("cache_version") == self.cache_version:
+                self.entries = saved["entries"]
+        
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+    
+    def save(
+        self
+    ) -> None:
+        
+        """
+        Saves the entries and the cache_version to
+        path, see model_functions.run_atomic_write.
+        """
+        
+        fp = os.path.join(main_dir, self.path)
+        
+        mf.run_atomic_write(
+            fp,
+            lambda f: pickle.dump(
+                {"cache_version": self.cache_version, "entries": self.entries}, 
+                f
+            )
+        )
+    
+    
+class ResultCache:
+    
+    """
+    Persistent cache of Model results, one pickled
+    DataFrame per key. The key hashes the content of
+    the input file and the canonical json of the
+    relevant config sections, so any change to the
+    data or config misses.
+    """
+    
+    # bump when a code change alters the results
+    cache_version: int = 1
+    
+    def __init__(
+        self,
+        cache_dir: str
+    ) -> None:
+        
+        """
+        :param cache_dir:
+            str, cache directory relative to the
+            main dir, created if missing.
+        """
+        
+        self.cache_dir = os.path.join(main_dir, cache_dir)
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+    
+    def gen_key(
+        self,
+        filepath: str,
+        config: Dict[str, Any],
+        sections: Iterable[str] = ("Ingest", "StatsTesting2x2Cont")
+    ) -> str:
+        
+        """
+        Function to generate the cache key of a run.
+        
+        :param filepath:
+            str, input file path relative to the
+            main dir.
+        :param config:
+            Dict[str,Any], loaded config file.
+        :param sections:
+            Iterable[str], config sections the results
+            depend on.
+        :return key:
+            str, sha256 hex digest.
+        """
+        
+        config_sub = {i: config.get(i) for i in sections}
+        config_json = json.dumps(
+            config_sub, 
+            sort_keys=True, 
+            default=str
+        )
+        
+        h = hashlib.sha256()
+        h.update(str(self.cache_version).encode())
+        h.update(self.gen_file_hash(filepath).encode())
+        h.update(config_json.encode())
+        
+        key = h.hexdigest()
+        
+        return key
+    
+    @staticmethod
+    def gen_file_hash(
+        filepath: str,
+        block_size: int = 1 << 20
+    ) -> str:
+        
+        """
+        Function to hash the content of a file
+        in blocks.
+        
+        :param filepath:
+            str, file path relative to the main dir.
+        :param block_size:
+            int, bytes read per block.
+        :return digest:
+            str, sha256 hex digest.
+        """
+        
+        h = hashlib.sha256()
+        
+        with open(os.path.join(main_dir, filepath), "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                h.update(block)
+                
+        digest = h.hexdigest()
+        
+        return digest
+    
+    def get(
+        self,
+        key: str
+    ) -> Optional[DataFrame]:
+        
+        """
+        Returns the stored results or None.
+        """
+        
+        fp = os.path.join(self.cache_dir, f"{key}.pkl")
+        
+        if not os.path.exists(fp):
+            return None
+        
+        df = pd.read_pickle(fp)
+        
+        return df
+    
+    def put(
+        self,
+        key: str,
+        df: DataFrame
+    ) -> None:
+        
+        """
+        Stores the results, see
+        model_functions.run_atomic_write.
+        """
+        
+        fp = os.path.join(self.cache_dir, f"{key}.pkl")
+        
+        mf.run_atomic_write(fp, df.to_pickle)
+    
+    
+class StatsResult2x2:
+    
+    """
+    Slim result record of a single 2x2 table test,
+    see StatsTesting2x2Cont.run_testing_record.
+    
+    Holds the numeric outputs only; to_dict and
+    to_frame build the containers on request.
+    """
+    
+    __slots__ = (
+        'grpers_val',
+        'significant',
+        'statistic',
+        'pvalue',
+        'alpha',
+        'dof',
+        'test',
+        'tbl',
+        'expected_freq',
+        'phi_corr_coeff',
+        'four_fifths_ratio',
+        'percent_target_succ',
+        'percent_non_target_succ'
+    )
+    
+    def __init__(
+        self,
+        grpers_val: str,
+        significant: bool,
+        statistic: float,
+        pvalue: float,
+        alpha: float,
+        dof: float,
+        test: str,
+        tbl: np.ndarray,
+        expected_freq: np.ndarray,
+        phi_corr_coeff: float,
+        four_fifths_ratio: float,
+        percent_target_succ: float,
+        percent_non_target_succ: float
+    ) -> None:
+        
+        """
+        :param grpers_val:
+            str, the value of the analysis group.
+        :param significant:
+            bool, pvalue <= alpha.
+        :param statistic, pvalue, alpha, dof:
+            float, test stats, see gen_hypothesis_eval.
+        :param test:
+            str, test used, 'chi2', 'fisher' or
+            'permutation'.
+        :param tbl:
+            np.ndarray, 2x2 cont table.
+        :param expected_freq:
+            np.ndarray, 2x2 expected frequencies.
+        :param phi_corr_coeff:
+            float, phi coefficient, nan when the
+            result is not significant.
+        :param four_fifths_ratio:
+            float, ratio of the target to the
+            non-target success percentage.
+        :param percent_target_succ, percent_non_target_succ:
+            float, success percentages.
+        """
+        
+        self.grpers_val = grpers_val
+        self.significant = significant
+        self.statistic = statistic
+        self.pvalue = pvalue
+        self.alpha = alpha
+        self.dof = dof
+        self.test = test
+        self.tbl = tbl
+        self.expected_freq = expected_freq
+        self.phi_corr_coeff = phi_corr_coeff
+        self.four_fifths_ratio = four_fifths_ratio
+        self.percent_target_succ = percent_target_succ
+        self.percent_non_target_succ = percent_non_target_succ
+    
+    def __repr__(
+        self
+    ) -> str:
+        
+        return (
+            f"StatsResult2x2(grpers_val={self.grpers_val!r}, test={self.test!r}, "
+            f"statistic={self.statistic:.4f}, pvalue={self.pvalue:.4g}, "
+            f"significant={self.significant})"
+        )
+    
+    def to_dict(
+        self
+    ) -> Dict[str, Any]:
+        
+        """
+        Returns the fields as a dict, tables as
+        nested lists.
+        """
+        
+        res = {i: getattr(self, i) for i in self.__slots__}
+        res['tbl'] = self.tbl.tolist()
+        res['expected_freq'] = self.expected_freq.tolist()
+        
+        return res
+    
+    def to_frame(
+        self
+    ) -> DataFrame:
+        
+        """
+        Returns the fields as a one row DataFrame.
+        """
+        
+        df = pd.DataFrame([self.to_dict()])
+        
+        return df
+    
+    
+class StatsTesting2x2Cont:
+    
+    """
+    Class to perform 2x2 Contigency Table analysis
+    with Chi2 and Phi Correlation Coefficent Testing.
+
+    Provides context into potential association between
+    variables and the strength of the association.
+    """
+    
+    # numeric fields the lazy narrative is rendered from
+    narrative_cols: List[str] = [
+        'four_fifths_ratio',
+        'percent_target_succ',
+        'percent_non_target_succ',
+        'diagonals'
+    ]
+    
+    def __init__(
+        self,
+        config: Dict[Any, Any],
+        tbl: List[int],
+        df: Optional[DataFrame] = None
+    ) -> None:
+        
+        """
+        Inits the class variables and unpacks the
+        config variables.
+        
+        :param config:
+            Dict[str,Any], loaded config file.
+        :param tbl:
+            List[int], 2x2 cont table, or an
+            (N, 2, 2) array for run_testing_batch.
+        :param df:
+            Optional[DataFrame], original input DataFrame,
+            not used by the testing and may be None.
+        """
+        
+        self.config = config
+        self.tbl = tbl
+        self.df = df
+
+        self.unpack_config()
+
+    def run_testing(
+        self
+    ) -> DataFrame:
+        
+        """
+        Run function for the class.
+        
+        Runs hypothesis evaluation and builds
+        the output report DataFrame.
+        
+        :param None:
+        :return df_results:
+            DataFrame, with testing results.
+        """
+        
+        alpha = self.alpha
+        tbl = self.tbl
+        process = self.process
+        group_variable = self.group_variable
+        group_target_val = self.group_target_val
+        group_other_val = self.group_other_val
+        bin_edges = self.bin_edges
+        bin_labels = self.bin_labels
+                
+        res = self.gen_hypothesis_eval(tbl)
+
+        df_results = self.run_report_bld(
+            alpha=alpha,
+            res=res,
+            tbl=tbl,
+            process=process,
+            group_variable=group_variable,
+            group_target_val=group_target_val,
+            group_other_val=group_other_val,
+            bin_edges=bin_edges,
+            bin_labels=bin_labels
+        )
+        
+        return df_results
+    
+    def run_testing_record(
+        self
+    ) -> StatsResult2x2:
+        
+        """
+        Low latency alternative to run_testing for a
+        single table, returns a StatsResult2x2 with
+        the numeric results and builds no DataFrame
+        or narrative.
+        
+        :param None:
+        :return res:
+            StatsResult2x2, testing results.
+        """
+        
+        alpha = self.alpha
+        tbl = np.asarray(self.tbl, dtype=np.int64).reshape(2, 2)
+        
+        statistic, pvalue, dof, expected, test = self.gen_hypothesis_eval(tbl)
+        
+        (
+            _,
+            A,
+            B,
+            C,
+            D,
+            total_target_grp,
+            total_non_target_grp,
+            diagonals,
+            percent_target_succ,
+            percent_non_target_succ,
+            phi_numerator,
+            phi_denominator
+        ) = self._gen_table_calcs(
+                df=None,
+                tbl=tbl
+        )
+        
+        significant = bool(pvalue <= alpha)
+        
+        if significant:
+            phi = float(phi_numerator / phi_denominator) if phi_denominator != 0 else 0.0
+        else:
+            phi = np.nan
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = float(percent_target_succ / percent_non_target_succ)
+        
+        res = StatsResult2x2(
+            grpers_val=self.grpers_val,
+            significant=significant,
+            statistic=float(statistic),
+            pvalue=float(pvalue),
+            alpha=alpha,
+            dof=float(dof),
+            test=test,
+            tbl=tbl,
+            expected_freq=np.asarray(expected),
+            phi_corr_coeff=phi,
+            four_fifths_ratio=ratio,
+            percent_target_succ=float(percent_target_succ),
+            percent_non_target_succ=float(percent_non_target_succ)
+        )
+        
+        return res
+    
+    def run_testing_batch(
+        self,
+        labels: np.ndarray
+    ) -> DataFrame:
+        
+        """
+        Run function for a stack of tables.
+        
+        Expects tbl to be an (N, 2, 2) array, runs the
+        vectorized hypothesis evaluation and builds the
+        report with one row per segment.
+        
+        :param labels:
+            np.ndarray, N analysis group values in
+            tbl order.
+        :return df_results:
+            DataFrame, with testing results.
+        """
+        
+        alpha = self.alpha
+        tbls = np.asarray(self.tbl).reshape(-1, 2, 2)
+        bin_edges = self.bin_edges
+        bin_labels = self.bin_labels
+        
+        res = self.gen_hypothesis_eval_batch(tbls)
+        
+        df_results = self.run_report_bld_batch(
+            alpha=alpha,
+            res=res,
+            tbls=tbls,
+            labels=labels,
+            bin_edges=bin_edges,
+            bin_labels=bin_labels
+        )
+        
+        return df_results
+    
+    def run_testing_stratified(
+        self
+    ) -> DataFrame:
+        
+        """
+        Run function for a stratified test.
+        
+        Expects tbl to be the (n_strata, 2, 2) array of
+        one analysis group and runs the Cochran-Mantel-
+        Haenszel test across the strata, i.e. whether
+        there is a disparity while controlling for the
+        analysis group.
+        
+        :param None:
+        :return df_results:
+            DataFrame, one row with the test results
+            and the Mantel-Haenszel common odds ratio.
+        """
+        
+        alpha = self.alpha
+        tbls = np.asarray(self.tbl, dtype=np.int64).reshape(-1, 2, 2)
+        
+        cmh = mf.gen_cmh_2x2(tbls)
+        
+        df = pd.DataFrame()
+        
+        df = self._gen_significance_test(
+            df=df,
+            pvalue=cmh['pvalue'],
+            alpha=alpha
+        )
+        
+        df.insert(0, 'grpers', ", ".join(Ingest._gen_grpers_cols(self.grpers)))
+        df['n_strata'] = cmh['n_strata']
+        df['statistic'] = cmh['statistic']
+        df['pvalue'] = cmh['pvalue']
+        df['alpha'] = alpha
+        df['dof'] = cmh['dof']
+        df['common_odds_ratio'] = cmh['common_odds_ratio']
+        df['common_odds_ratio_ci_lower'] = cmh['common_odds_ratio_ci_lower']
+        df['common_odds_ratio_ci_upper'] = cmh['common_odds_ratio_ci_upper']
+        df['tbl'] = [tbls.sum(axis=0).tolist()]
+        df['test'] = 'cmh'
+        
+        return df
+    
+    def unpack_config(
+        self
+    ) -> None:
+        
+        """
+        Function to unpack config variables.
+        
+        :param None:
+        :return None:
+        """
+        
+        config = self.config
+
+        try:
+            self.alpha: float = config["StatsTesting2x2Cont"]["alpha"]
+            self.group_variable: str = config["Ingest"]["group_variable"]
+            self.group_target_val: str = config["Ingest"]["group_target_val"]
+            self.group_other_val: str = config["Ingest"]["group_other_val"]
+            self.outcome_variable: str = config["Ingest"]["outcome_variable"]
+            self.outcome_target_val: str = config["Ingest"]["outcome_target_val"]
+            self.outcome_other_val: str = config["Ingest"]["outcome_other_val"]
+            self.grpers: Union[str, List[str]] = config["Ingest"]["grpers"]
+            self.grpers_val: str = config["Ingest"].get("grpers_val", "all")
+            
+            self.testing: str = config["StatsTesting2x2Cont"]["testing"]
+            self.process: str = config["StatsTesting2x2Cont"]["process"]
+            self.bin_edges: List[float] = config["StatsTesting2x2Cont"]["phi_bin_edges"]
+            self.bin_labels: List[str] = config["StatsTesting2x2Cont"]["phi_bin_labels"]
+            self.fisher_min_expected: Optional[float] = config["StatsTesting2x2Cont"].get(
+                "fisher_min_expected"
+            )
+            self.permutation: Optional[Dict[str, Any]] = config["StatsTesting2x2Cont"].get(
+                "permutation"
+            )
+            self.bootstrap: Optional[Dict[str, Any]] = config["StatsTesting2x2Cont"].get(
+                "bootstrap"
+            )
+            self.lazy_narrative: bool = config["StatsTesting2x2Cont"].get(
+                "lazy_narrative", False
+            )
+            self.effect_sizes: Optional[Dict[str, Any]] = config["StatsTesting2x2Cont"].get(
+                "effect_sizes"
+            )
+            self.correction: Optional[str] = config["StatsTesting2x2Cont"].get(
+                "correction"
+            )
+            self.cache_config: Optional[Dict[str, Any]] = config["StatsTesting2x2Cont"].get(
+                "cache"
+            )
+            self.n_workers: int = (config.get("Executor") or {}).get("n_workers", 1)
+            self.chunk_size: int = (config.get("Executor") or {}).get("chunk_size", 1024)
+
+            if not isinstance(self.alpha, float):
+                raise TypeError("Expected 'alpha' to be of type 'float'.")
+            if not isinstance(self.group_variable, str):
+                raise TypeError("Expected 'group_variable' to be of type 'str'.")
+            if not isinstance(self.group_target_val, str):
+                raise TypeError("Expected 'group_target_val' to be of type 'str'.")
+            if not isinstance(self.group_other_val, str):
+                raise TypeError("Expected 'group_other_val' to be of type 'str'.")
+            if not isinstance(self.outcome_variable, str):
+                raise TypeError("Expected 'outcome_variable' to be of type 'str'.")
+            if not isinstance(self.outcome_target_val, str):
+                raise TypeError("Expected 'outcome_target_val' to be of type 'str'.")
             if not isinstance(self.outcome_other_val, str):
                 raise TypeError("Expected 'outcome_other_val' to be of type 'str'.")
-            if not isinstance(self.grpers, str):
-                raise TypeError("Expected 'grpers' to be of type 'str'.")
+            if not isinstance(self.grpers, (str, list)):
+                raise TypeError("Expected 'grpers' to be of type 'str' or a list of strings.")
             if not isinstance(self.grpers_val, str):
-                raise TypeError("Expected 'grpers' to be of type 'str'.")
+                raise TypeError("Expected 'grpers_val' to be of type 'str'.")
             if not isinstance(self.testing, str):
                 raise TypeError("Expected 'testing' to be of type 'str'.")
             if not isinstance(self.process, str):
@@ -538,35 +2175,331 @@ class StatsTesting2x2Cont:
                 isinstance(i, str) for i in self.bin_labels
             ):
                 raise TypeError("Expected 'bin_labels' to be a list of strings.")
+            if self.fisher_min_expected is not None and not isinstance(
+                self.fisher_min_expected, (int, float)
+            ):
+                raise TypeError("Expected 'fisher_min_expected' to be of type 'float'.")
+            if self.permutation is not None and not isinstance(self.permutation, dict):
+                raise TypeError("Expected 'permutation' to be of type 'dict'.")
+            if self.bootstrap is not None and not isinstance(self.bootstrap, dict):
+                raise TypeError("Expected 'bootstrap' to be of type 'dict'.")
+            if not isinstance(self.lazy_narrative, bool):
+                raise TypeError("Expected 'lazy_narrative' to be of type 'bool'.")
+            if self.effect_sizes is not None and not isinstance(self.effect_sizes, dict):
+                raise TypeError("Expected 'effect_sizes' to be of type 'dict'.")
+            if self.correction is not None and not isinstance(self.correction, str):
+                raise TypeError("Expected 'correction' to be of type 'str'.")
+            if self.correction is not None and self.correction not in ('bonferroni', 'holm', 'bh'):
+                raise ValueError("Expected 'correction' to be 'bonferroni', 'holm' or 'bh'.")
+            if self.cache_config is not None and not isinstance(self.cache_config, dict):
+                raise TypeError("Expected 'cache' to be of type 'dict'.")
+            if not isinstance(self.n_workers, int) or self.n_workers <= 0:
+                raise TypeError("Expected 'n_workers' to be a positive 'int'.")
+            if not isinstance(self.chunk_size, int) or self.chunk_size <= 0:
+                raise TypeError("Expected 'chunk_size' to be a positive 'int'.")
+        
+        except KeyError as e:
+            raise KeyError(
+                f"Missing key '{e.args[0]}' in the config file. "
+                f"Ensure all required keys are present in the 'Ingest' and 'StatsTesting2x2Cont' sections."
+            )
+        
+        except TypeError as e:
+            raise TypeError(f"Config file error: {e}")
+        
+        # permutation pvalues are random, only cache exact tests
+        if self.cache_config is not None and self.permutation is None:
+            self.cache: Optional[StatsCache] = StatsCache.get_instance(
+                maxsize=self.cache_config.get("maxsize", 100000),
+                path=self.cache_config.get("path")
+            )
+        else:
+            self.cache = None
+
+        
+    def gen_hypothesis_eval(
+        self,
+        tbl: List[int]
+    ) -> Tuple[float, float, float, np.ndarray, str]:
+        
+        """
+        Function to generate the chi2_contigency
+        statistic and result.
+        
+        Switches to Fisher's exact test when any expected
+        cell count is below fisher_min_expected, the
+        statistic is then the sample odds ratio of
+        success, target vs non-target group, and dof is
+        nan, see gen_fisher_exact. When permutation is configured the
+        pvalue comes from the Monte Carlo permutation
+        test instead, see gen_permutation_pvalue. A table
+        with an empty row or column cannot be tested, it
+        gets nan stats and test 'untestable' as in
+        gen_hypothesis_eval_batch.
+        
+        Results are memoized in the 'cache' config
+        section's StatsCache when set: maxsize (default
+        100000) and path (default None, in memory only).
+        The batch path is not cached.
+        
+        :param tbl:
+            List[int], 2x2 cont table.
+        :return (statistic, pvalue, dof, expected_freq, test):
+            Tuple[float, float, float, np.ndarray, str], the
+            chi2_contingency result and the name of the test
+            used, 'chi2', 'fisher', 'permutation' or
+            'untestable'.
+        """
+        
+        cache = self.cache
+        
+        if cache is not None:
+            key = self._gen_cache_key(tbl)
+            res = cache.get(key)
+            
+            if res is None:
+                res = self._gen_hypothesis_eval(tbl)
+                cache.put(key, res)
+                
+            return res
+        
+        res = self._gen_hypothesis_eval(tbl)
+        
+        return res
+    
+    def _gen_hypothesis_eval(
+        self,
+        tbl: List[int]
+    ) -> Tuple[float, float, float, np.ndarray, str]:
+        
+        """
+        Uncached gen_hypothesis_eval.
+        """
+        
+        fisher_min_expected = self.fisher_min_expected
+        permutation = self.permutation
+        
+        expected = expected_freq(tbl)
+        
+        tbl_arr = np.asarray(tbl).reshape(2, 2)
+        testable = np.all(tbl_arr.sum(axis=0)) and np.all(tbl_arr.sum(axis=1))
+        
+        if permutation is not None:
+            res = tuple(
+                i[0] for i in self.gen_hypothesis_eval_batch(tbl)
+            )
+        
+        elif not testable:
+            res = (np.nan, np.nan, np.nan, expected, 'untestable')
+        
+        elif fisher_min_expected is not None and np.any(expected < fisher_min_expected):
+            statistic, pvalue = self.gen_fisher_exact(tbl)
+            
+            res = (statistic[0], pvalue[0], np.nan, expected, 'fisher')
+            
+        else:
+            res = (
+                *chi2_contingency(
+                    tbl
+                ),
+                'chi2'
+            )
+            
+        return res
+    
+    def gen_hypothesis_eval_batch(
+        self,
+        tbls: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        
+        """
+        Function to generate the chi2_contingency
+        statistic and result for a stack of tables
+        in one vectorized pass.
+        
+        Gives the same values as gen_hypothesis_eval
+        table by table, including the switch to
+        Fisher's exact test and the permutation test.
+        Tables with an empty row or column cannot be
+        tested, they get nan stats and test 'untestable'.
+        
+        :param tbls:
+            np.ndarray, (N, 2, 2) cont tables.
+        :return (statistic, pvalue, dof, expected_freq, test):
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+            indexed like the gen_hypothesis_eval result.
+        """
+        
+        fisher_min_expected = self.fisher_min_expected
+        permutation = self.permutation
+        
+        tbls = np.asarray(tbls).reshape(-1, 2, 2)
+        
+        statistic, pvalue, dof, expected = mf.gen_chi2_2x2(
+            tbls
+        )
+        
+        test = np.full(len(tbls), 'chi2', dtype=object)
+        
+        testable = (
+            np.all(tbls.sum(axis=1), axis=1) & np.all(tbls.sum(axis=2), axis=1)
+        )
+        
+        if permutation is not None:
+            pvalue = np.full(len(tbls), np.nan)
+            pvalue[testable] = self.gen_permutation_pvalue(tbls[testable])
+            dof = np.full(len(tbls), np.nan)
+            test[:] = 'permutation'
+        
+        elif fisher_min_expected is not None:
+            fisher = testable & np.any(expected < fisher_min_expected, axis=(1, 2))
+            
+            dof = dof.astype(np.float64)
+            statistic[fisher], pvalue[fisher] = self.gen_fisher_exact(tbls[fisher])
+            dof[fisher] = np.nan
+            test[fisher] = 'fisher'
         
-        except KeyError as e:
-            raise KeyError(
-                f"Missing key '{e.args[0]}' in the config file. "
-                f"Ensure all required keys are present in the 'Ingest' and 'StatsTesting2x2Cont' sections."
-            )
-
-        except TypeError as e:
-            raise TypeError(f"Config file error: {e}")
-
+        if not testable.all():
+            dof = dof.astype(np.float64)
+            statistic[~testable] = np.nan
+            pvalue[~testable] = np.nan
+            dof[~testable] = np.nan
+            test[~testable] = 'untestable'
         
-    def gen_hypothesis_eval(
+        res = (statistic, pvalue, dof, expected, test)
+        
+        return res
+        
+    def gen_fisher_exact(
+        self,
+        tbls: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        
+        """
+        Function to run Fisher's exact test, see
+        model_functions.gen_fisher_exact_2x2.
+        
+        The statistic is reported as the odds ratio of
+        success for the target vs the non-target group,
+        (B * C) / (A * D), the orientation of the
+        effect_sizes odds_ratio column. It is the
+        reciprocal of the scipy.stats.fisher_exact
+        statistic, (A * D) / (B * C).
+        
+        Runs on a process pool of the 'Executor'
+        section's n_workers (default 1), in tasks of
+        chunk_size tables (default 1024).
+        
+        :param tbls:
+            np.ndarray, (N, 2, 2) or (2, 2) cont tables.
+        :return (statistic, pvalue):
+            Tuple[np.ndarray, np.ndarray], arrays of shape (N,).
+        """
+        
+        statistic, pvalue = mf.run_fisher_exact_2x2(
+            tbls,
+            n_workers=self.n_workers,
+            chunk_size=self.chunk_size
+        )
+        
+        with np.errstate(divide='ignore'):
+            statistic = 1 / statistic
+        
+        return statistic, pvalue
+    
+    def _gen_cache_key(
         self,
         tbl: List[int]
-    ) -> chi2_contingency:
+    ) -> Tuple[Any, ...]:
         
         """
-        Function to generate the chi2_contigency
-        statistic and result.
+        Method to build the cache key of a table, its
+        counts (A, B, C, D) and the test options.
+        
+        :param tbl:
+            List[int], 2x2 cont table.
+        :return key:
+            Tuple[Any, ...], hashable key.
+        """
+        
+        counts = tuple(int(i) for i in np.asarray(tbl).reshape(-1))
+        
+        key = counts + (self.fisher_min_expected,)
+        
+        return key
+    
+    def gen_permutation_pvalue(
+        self,
+        tbls: np.ndarray
+    ) -> np.ndarray:
+        
+        """
+        Function to generate Monte Carlo permutation
+        pvalues for a stack of tables.
+        
+        Reads the 'permutation' config section:
+        n_permutations (default 10000), seed (default
+        None), early_stop (default True, stops a table
+        once its pvalue is clearly on one side of alpha),
+        block_size (default 1000), n_workers (default 1)
+        and chunk_size (default 256 tables per task).
+        
+        :param tbls:
+            np.ndarray, (N, 2, 2) cont tables.
+        :return pvalue:
+            np.ndarray, permutation pvalues.
+        """
+        
+        alpha = self.alpha
+        permutation = self.permutation
+        
+        pvalue, _ = mf.run_permutation_2x2(
+            tbls,
+            n_permutations=permutation.get("n_permutations", 10000),
+            seed=permutation.get("seed"),
+            alpha=alpha if permutation.get("early_stop", True) else None,
+            block_size=permutation.get("block_size", 1000),
+            n_workers=permutation.get("n_workers", 1),
+            chunk_size=permutation.get("chunk_size", 256)
+        )
+        
+        return pvalue
+        
+    def gen_bootstrap_ci_batch(
+        self,
+        tbls: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        
+        """
+        Function to generate percentile bootstrap
+        confidence intervals for the four-fifths ratio
+        and phi of a stack of tables.
+        
+        Reads the 'bootstrap' config section: n_boot
+        (default 2000), seed (default None), ci (default
+        0.95), n_workers (default the 'Executor'
+        section's n_workers) and chunk_size (default 256
+        tables per task).
+        
+        :param tbls:
+            np.ndarray, (N, 2, 2) cont tables.
+        :return (ratio_ci, phi_ci):
+            Tuple[np.ndarray, np.ndarray], lower and upper
+            bounds of shape (N, 2).
         """
         
-        #size = np.shape(tbl)
-        #tbl_len = len(tbl)
+        bootstrap = self.bootstrap
         
-        res = chi2_contingency(
-            tbl
+        ratio_ci, phi_ci = mf.run_bootstrap_2x2(
+            tbls,
+            n_boot=bootstrap.get("n_boot", 2000),
+            seed=bootstrap.get("seed"),
+            ci=bootstrap.get("ci", 0.95),
+            n_workers=bootstrap.get("n_workers", self.n_workers),
+            chunk_size=bootstrap.get("chunk_size", 256)
         )
-            
-        return res
+        
+        return ratio_ci, phi_ci
         
     def run_report_bld(
         self,
@@ -620,7 +2553,8 @@ class StatsTesting2x2Cont:
         df = self._gen_significance_test(
             df=df,
             pvalue=pvalue,
-            alpha=alpha
+            alpha=alpha,
+            test=res[4]
         )
         
         (
@@ -674,6 +2608,7 @@ class StatsTesting2x2Cont:
             df,
             round(res[1],3),
             phi_result,
+            res[4]
         )
         
         df = self._gen_unpack_stats(
@@ -683,6 +2618,319 @@ class StatsTesting2x2Cont:
             alpha
         )
         
+        # a single test, the adjusted pvalue is the raw one
+        if self.correction is not None:
+            df['pvalue_adjusted'] = mf.gen_adjusted_pvalues(
+                np.array([res[1]]), 
+                self.correction
+            )
+            df['correction'] = self.correction
+        
+        if self.bootstrap is not None:
+            df = self._gen_bootstrap_ci(
+                df,
+                tbl
+            )
+        
+        if self.effect_sizes is not None:
+            for col, val in self.gen_effect_sizes(A, B, C, D).items():
+                df[col] = val
+        
+        return df
+    
+    def gen_effect_sizes(
+        self,
+        A: np.ndarray,
+        B: np.ndarray,
+        C: np.ndarray,
+        D: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        
+        """
+        Function to generate the odds ratio, relative
+        risk and Wilson selection-rate intervals from
+        the cells of _gen_table_calcs.
+        
+        Reads the 'effect_sizes' config section:
+        continuity_correction (default 0.5, added to
+        every cell of a table with a zero cell) and ci
+        (default 0.95).
+        
+        :param A, B, C, D:
+            np.ndarray, cell counts.
+        :return effect_sizes:
+            Dict[str, np.ndarray], one value per report
+            column, see model_functions.gen_effect_sizes_2x2.
+        """
+        
+        effect_sizes = self.effect_sizes
+        
+        res = mf.gen_effect_sizes_2x2(
+            A,
+            B,
+            C,
+            D,
+            continuity_correction=effect_sizes.get("continuity_correction", 0.5),
+            ci=effect_sizes.get("ci", 0.95)
+        )
+        
+        return res
+    
+    def run_report_bld_batch(
+        self,
+        alpha: float,
+        res: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+        tbls: np.ndarray,
+        labels: np.ndarray,
+        bin_edges: List[float],
+        bin_labels: List[str]
+    ) -> DataFrame:
+        
+        """
+        Runs the report for a stack of tables.
+        
+        Computes every column as an array over the
+        segments and assembles the DataFrame once. Rows
+        hold the run_report_bld columns, after the
+        grpers and grpers_val columns.
+        
+        When correction is configured ('bonferroni',
+        'holm' or 'bh') the pvalues are adjusted across
+        the batch, test_result and result_desc follow the
+        adjusted value and pvalue_adjusted is added.
+        
+        :param alpha:
+            float, alpha value for significance evaluation.
+        :param res:
+            Tuple[np.ndarray, ...], result of
+            gen_hypothesis_eval_batch.
+        :param tbls:
+            np.ndarray, (N, 2, 2) cont tables.
+        :param labels:
+            np.ndarray, N analysis group values.
+        :param bin_edges:
+            List[float], edges for phi
+            bins.
+        :param bin_labels:
+            List[str], labels for the phi
+            bins.
+        :return df:
+            DataFrame, one row per segment.
+        """
+        
+        statistic, pvalue, dof, expected, test = res
+        
+        grpers = ", ".join(Ingest._gen_grpers_cols(self.grpers))
+        grpers_vals = [Transform._gen_label_desc(label) for label in labels]
+        
+        rows = [self.group_target_val, self.group_other_val]
+        cols = [self.outcome_other_val, self.outcome_target_val]
+        
+        tbls = np.asarray(tbls, dtype=np.int64)
+        
+        (
+            _,
+            A,
+            B,
+            C,
+            D,
+            total_target_grp,
+            total_non_target_grp,
+            diagonals,
+            percent_target_succ,
+            percent_non_target_succ,
+            phi_numerator,
+            phi_denominator
+        ) = self._gen_table_calcs(
+                df=None,
+                tbl=tbls,
+        )
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = percent_target_succ / percent_non_target_succ
+            phi = np.where(phi_denominator != 0, phi_numerator / phi_denominator, 0)
+        
+        if self.correction is not None:
+            pvalue_adjusted = mf.gen_adjusted_pvalues(pvalue, self.correction)
+        else:
+            pvalue_adjusted = pvalue
+        
+        significant = pvalue_adjusted <= alpha
+        
+        test_result = np.select(
+            [test == 'untestable', significant],
+            [
+                'Untestable, the table has an empty row or column',
+                'Statistically significant result'
+            ],
+            'No statistically significant result'
+        )
+        
+        phi_corr_coeff = np.where(significant, phi, np.nan)
+        
+        phi_bins = mf.gen_cut(
+            phi_corr_coeff, 
+            bin_edges=bin_edges, 
+            bin_labels=bin_labels
+        )
+        
+        data = {
+            'grpers': grpers,
+            'grpers_val': grpers_vals,
+            'test_result': test_result,
+            'phi_corr_coeff': phi_corr_coeff,
+            'phi_bins': phi_bins,
+            'four_fifths_test': None,
+            'result_desc': None,
+            'statistic': statistic,
+            'pvalue': pvalue,
+            'alpha': alpha,
+            'dof': dof,
+            'tbl_rows': [rows] * len(tbls),
+            'tbl_cols': [cols] * len(tbls),
+            'tbl': tbls.tolist(),
+            'expected_freq': list(expected),
+            'tbl_expected_diff': list(tbls - expected),
+            'test': test
+        }
+        
+        if self.correction is not None:
+            data['pvalue_adjusted'] = pvalue_adjusted
+            data['correction'] = self.correction
+        
+        if self.bootstrap is not None:
+            ratio_ci, phi_ci = self.gen_bootstrap_ci_batch(tbls)
+            
+            data['four_fifths_ratio_ci_lower'] = ratio_ci[:, 0]
+            data['four_fifths_ratio_ci_upper'] = ratio_ci[:, 1]
+            data['phi_ci_lower'] = phi_ci[:, 0]
+            data['phi_ci_upper'] = phi_ci[:, 1]
+        
+        if self.effect_sizes is not None:
+            data.update(self.gen_effect_sizes(A, B, C, D))
+        
+        data['four_fifths_ratio'] = ratio
+        data['percent_target_succ'] = percent_target_succ
+        data['percent_non_target_succ'] = percent_non_target_succ
+        data['diagonals'] = diagonals
+        
+        df = pd.DataFrame(data)
+        
+        if not self.lazy_narrative:
+            df = self.run_narrative(df)
+            df = df.drop(columns=self.narrative_cols)
+        
+        return df
+    
+    def run_narrative(
+        self,
+        df: DataFrame
+    ) -> DataFrame:
+        
+        """
+        Renders the four_fifths_test and result_desc
+        text of a batch report from its numeric fields.
+        
+        With lazy_narrative the batch report leaves both
+        columns empty and keeps the narrative_cols, pass
+        only the rows that are displayed or exported.
+        
+        :param df:
+            DataFrame, rows of run_report_bld_batch.
+        :return df:
+            DataFrame, copy with the text filled in.
+        """
+        
+        df = df.copy()
+        
+        four_fifths_test = [
+            self._gen_four_fifths_desc(i) for i in df['four_fifths_ratio'].to_numpy().tolist()
+        ]
+        
+        result_desc = [""] * len(df)
+        
+        significant = np.flatnonzero(
+            df['test_result'].to_numpy() == 'Statistically significant result'
+        )
+        
+        # gather the fields once, a row lookup per segment is slow
+        cols = zip(
+            significant,
+            *(
+                df[col].to_numpy()[significant]
+                for col in (
+                    'diagonals',
+                    'phi_corr_coeff',
+                    'phi_bins',
+                    'percent_non_target_succ',
+                    'percent_target_succ',
+                    'grpers_val',
+                    'test_result',
+                    'test'
+                )
+            )
+        )
+        
+        for (
+            i,
+            diagonals,
+            phi_corr_coeff,
+            phi_bin,
+            percent_non_target_succ,
+            percent_target_succ,
+            grpers_val,
+            test_result,
+            test
+        ) in cols:
+            phi_result = self._gen_phi_desc(
+                diagonals=diagonals,
+                phi_corr_coeff=phi_corr_coeff,
+                phi_bin=phi_bin,
+                process=self.process,
+                group_variable=self.group_variable,
+                group_other_val=self.group_other_val,
+                group_target_val=self.group_target_val,
+                percent_non_target_succ=percent_non_target_succ,
+                percent_target_succ=percent_target_succ
+            )
+            result_desc[i] = self._gen_result_desc(
+                grpers_val=grpers_val,
+                result=test_result,
+                four_fifths=four_fifths_test[i],
+                phi_result=phi_result,
+                test=test
+            )
+        
+        df['four_fifths_test'] = four_fifths_test
+        df['result_desc'] = result_desc
+        
+        return df
+    
+    def _gen_bootstrap_ci(
+        self,
+        df: DataFrame,
+        tbl: List[int]
+    ) -> DataFrame:
+        
+        """
+        Method to add the bootstrap confidence
+        intervals of the four-fifths ratio and phi.
+        
+        :param df:
+            DataFrame, output df.
+        :param tbl:
+            List[int], 2x2 cont table.
+        :return df:
+            DataFrame, output df.
+        """
+        
+        ratio_ci, phi_ci = self.gen_bootstrap_ci_batch(tbl)
+        
+        df['four_fifths_ratio_ci_lower'] = ratio_ci[0, 0]
+        df['four_fifths_ratio_ci_upper'] = ratio_ci[0, 1]
+        df['phi_ci_lower'] = phi_ci[0, 0]
+        df['phi_ci_upper'] = phi_ci[0, 1]
+        
         return df
         
     def _gen_unpack_stats(
@@ -700,7 +2948,8 @@ class StatsTesting2x2Cont:
         :param df:
             DataFrame, output df.
         :param res:
-            chi2_contingency, results array.
+            chi2_contingency, results array, see
+            gen_hypothesis_eval.
         :return df:
             DataFrame, output df.
         """
@@ -722,6 +2971,7 @@ class StatsTesting2x2Cont:
         df['tbl'] = [tbl]
         df['expected_freq'] = [res[3]]
         df['tbl_expected_diff'] = [tbl - res[3]]
+        df['test'] = res[4]
         
         return df
     
@@ -729,7 +2979,8 @@ class StatsTesting2x2Cont:
         self,
         df: DataFrame,
         pvalue: float,
-        alpha: float
+        alpha: float,
+        test: str
     ):
         """
         Method to report on test significance.
@@ -740,11 +2991,16 @@ class StatsTesting2x2Cont:
             int, pvalue.
         :param alpha:
             float, the alpha value for testing eval.
+        :param test:
+            str, test used, see gen_hypothesis_eval.
         :return df:
             DataFrame with metadata added.     
         """
             
-        if pvalue <= alpha:
+        if test == 'untestable':
+            val = 'Untestable, the table has an empty row or column'
+            
+        elif pvalue <= alpha:
             val = 'Statistically significant result'
             
         else:
@@ -836,6 +3092,10 @@ class StatsTesting2x2Cont:
         explainability on the magnitude of association, when 
         an association is found.
         
+        Works on a single table or on an (N, 2, 2) array,
+        in which case every value is an array over the
+        tables.
+        
         :param df:
             DataFrame, output df.
         :param tbl:
@@ -852,15 +3112,22 @@ class StatsTesting2x2Cont:
         ]
         """
         
+        tbl = np.asarray(tbl, dtype=np.float64)
+        
         # females, males; no succ, succ
-        A, B = tbl[0] 
-        C, D = tbl[1]
+        A = tbl[..., 0, 0]
+        B = tbl[..., 0, 1]
+        C = tbl[..., 1, 0]
+        D = tbl[..., 1, 1]
         
         total_target_grp = A + B
         total_non_target_grp = C + D
         diagonals = (A + D) > (B + C)
-        percent_target_succ = (B / total_target_grp) * 100
-        percent_non_target_succ = (D / total_non_target_grp) * 100
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percent_target_succ = (B / total_target_grp) * 100
+            percent_non_target_succ = (D / total_non_target_grp) * 100
+            
         phi_numerator = (A * D) - (B * C)
         phi_denominator = np.sqrt((A + B) * (C + D) * (A + C) * (B + D))      
            
@@ -887,8 +3154,8 @@ class StatsTesting2x2Cont:
     ) -> DataFrame:
         
         """
-        Method to generate pandas bins for 
-        phi coeff.
+        Method to generate the bins for 
+        phi coeff, see model_functions.gen_cut.
         
         :param df:
             DataFrame, output df.
@@ -902,11 +3169,10 @@ class StatsTesting2x2Cont:
             DataFrame, output df.
         """
     
-        df['phi_bins'] = pd.cut(
-            df['phi_corr_coeff'], 
-            bins=bin_edges, 
-            labels=bin_labels, 
-            include_lowest=True
+        df['phi_bins'] = mf.gen_cut(
+            df['phi_corr_coeff'].to_numpy(), 
+            bin_edges=bin_edges, 
+            bin_labels=bin_labels
         )
         
         return df
@@ -920,16 +3186,35 @@ class StatsTesting2x2Cont:
         
         ratio = percent_target_succ / percent_non_target_succ
         
-        if ratio < .8:
-            ratio_desc = f'4/5ths Test failed at ratio of: {round(ratio,3)}.'
-        elif ratio >= .8:
-            ratio_desc = f'4/5ths Test passed at a ratio of: {round(ratio,3)}.'
-        else:
-            ratio_desc = 'Error calculating 4/5 Test'
+        ratio_desc = self._gen_four_fifths_desc(ratio)
         
         df['four_fifths_test'] = ratio_desc
         return df
     
+    def _gen_four_fifths_desc(
+        self,
+        ratio: float
+    ) -> str:
+        
+        """
+        Method to describe the 4/5ths test result.
+        
+        :param ratio:
+            float, ratio of the target to the
+            non-target success percentage.
+        :return ratio_desc:
+            str, test description.
+        """
+        
+        if ratio < .8:
+            ratio_desc = narrative_templates["four_fifths_failed"].format(ratio=round(ratio,3))
+        elif ratio >= .8:
+            ratio_desc = narrative_templates["four_fifths_passed"].format(ratio=round(ratio,3))
+        else:
+            ratio_desc = narrative_templates["four_fifths_error"]
+            
+        return ratio_desc
+    
     def _gen_prep_diagonals(
         self,
         df: DataFrame,
@@ -975,28 +3260,67 @@ class StatsTesting2x2Cont:
         phi_bin = df['phi_bins'].values[0]    
         phi_corr_coeff = df['phi_corr_coeff'].values[0]    
 
+        phi_col = self._gen_phi_desc(
+            diagonals=diagonals,
+            phi_corr_coeff=phi_corr_coeff,
+            phi_bin=phi_bin,
+            process=process,
+            group_variable=group_variable,
+            group_other_val=group_other_val,
+            group_target_val=group_target_val,
+            percent_non_target_succ=percent_non_target_succ,
+            percent_target_succ=percent_target_succ
+        )
+            
+        return df, phi_col
+    
+    def _gen_phi_desc(
+        self,
+        diagonals: bool,
+        phi_corr_coeff: float,
+        phi_bin: str,
+        process: str,
+        group_variable: str,
+        group_other_val: str,
+        group_target_val: str,
+        percent_non_target_succ: float,
+        percent_target_succ: float
+    ) -> str:
+        
+        """
+        Method to describe the phi coefficient
+        analysis, see _gen_prep_diagonals.
+        
+        :return phi_col:
+            str, phi description.
+        """
+
         if diagonals:
-            diagonal_msg = (
-                f"The values on the positive diagonal of the 'tbl' indicate the distribution of {process} success across {group_variable} categories.\n\n"
-                f"{group_other_val} had a higher proportion of successful outcomes compared to {group_target_val}.\n\n"
-                f"Specifically, {percent_non_target_succ:.1f}% of {group_other_val} had success while only {percent_target_succ:.1f}%"
-                f" of {group_target_val} had success.\n\n"
-                f"This significant difference in {process} success rates suggests a potential {group_variable} bias, with {group_other_val} success in {process}"
-                f" at a higher rate than {group_target_val}."
+            diagonal_msg = narrative_templates["diagonal"].format(
+                process=process,
+                group_variable=group_variable,
+                group_other_val=group_other_val,
+                group_target_val=group_target_val,
+                percent_non_target_succ=percent_non_target_succ,
+                percent_target_succ=percent_target_succ
+            )
+            phi_col = narrative_templates["phi"].format(
+                phi_corr_coeff=phi_corr_coeff,
+                phi_bin=phi_bin,
+                diagonal_msg=diagonal_msg
             )
-            phi_col = f"The phi correlation coefficient is {phi_corr_coeff:.3f}, indicating a {phi_bin} effect size. {diagonal_msg}"
             
         else:
-            diagonal_msg = "The diagonal values are not substantially higher, suggesting the relationship might be more nuanced."
-            phi_col = diagonal_msg
+            phi_col = narrative_templates["no_diagonal"]
             
-        return df, phi_col
+        return phi_col
     
     def _gen_outcome_meta(
         self,
         df: DataFrame,
         pval: float,
-        phi_result: str
+        phi_result: str,
+        test: str
     ) -> DataFrame:
         
         """
@@ -1009,26 +3333,93 @@ class StatsTesting2x2Cont:
             int, pvalue
         :param phi_result:
             str, result of phi testing.
+        :param test:
+            str, test used, 'chi2', 'fisher' or
+            'permutation'.
         :return df:
             DataFrame with metadata added
         """
         
-        grpers = self.grpers
         grpers_val = self.grpers_val
         result = df['test_result'].values[0]
-        phi_col = df['phi_corr_coeff'].values[0]
+        four_fifths = df['four_fifths_test'].values[0]
+        
+        col = self._gen_result_desc(
+            grpers_val=grpers_val,
+            result=result,
+            four_fifths=four_fifths,
+            phi_result=phi_result,
+            test=test
+        )
+                
+        df['result_desc'] = col
+        
+        return df
+    
+    def _gen_result_desc(
+        self,
+        grpers_val: str,
+        result: str,
+        four_fifths: str,
+        phi_result: str,
+        test: str
+    ) -> str:
+        
+        """
+        Method to describe the testing result,
+        see _gen_outcome_meta.
+        
+        :param grpers_val:
+            str, the value of the analysis group.
+        :param result:
+            str, the test_result.
+        :param four_fifths:
+            str, the 4/5ths test description.
+        :param phi_result:
+            str, result of phi testing.
+        :param test:
+            str, test used, 'chi2', 'fisher',
+            'permutation' or 'untestable'.
+        :return col:
+            str, result description, empty when the
+            result is not significant.
+        """
+        
+        grpers = Ingest._gen_grpers_cols(self.grpers)
+        grpers = ", ".join(grpers)
         testing = self.testing
         process = self.process
         group_target_val = self.group_target_val
         alpha = self.alpha
-        four_fifths = df['four_fifths_test'].values[0]
         
         if result == "Statistically significant result":
-            col = f"Testing for {grpers}: {grpers_val}, {four_fifths}\n\nBased on the results of the chi-square test of independence, there is {result} for {testing}-based {process} discrimination against {group_target_val} at the chosen significance level of {alpha}.\n\n"
-            col = f"{col}{phi_result}"
+            test_desc = {
+                'chi2': 'the chi-square test of independence',
+                'fisher': "Fisher's exact test",
+                'permutation': 'the permutation test'
+            }[test]
+            
+            if self.correction is not None:
+                correction_desc = {
+                    'bonferroni': 'Bonferroni',
+                    'holm': 'Holm',
+                    'bh': 'Benjamini-Hochberg'
+                }[self.correction]
+                test_desc = f"{test_desc} with {correction_desc} correction"
+            
+            col = narrative_templates["result"].format(
+                grpers=grpers,
+                grpers_val=grpers_val,
+                four_fifths=four_fifths,
+                test_desc=test_desc,
+                result=result,
+                testing=testing,
+                process=process,
+                group_target_val=group_target_val,
+                alpha=alpha,
+                phi_result=phi_result
+            )
         else: 
             col = ""
-                
-        df['result_desc'] = col
         
-        return df
+        return col
@@ -0,0 +1,1242 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+from typing import Any
+from typing import BinaryIO
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from scipy import special
+
+def gen_chi2_2x2(
+    tbls: np.ndarray,
+    correction: bool = True
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+
+    """
+    Closed form chi2 test of independence for a
+    stack of 2x2 contingency tables.
+
+    Matches scipy.stats.chi2_contingency, including
+    the Yates continuity correction it applies to
+    2x2 tables by default. Tables with an empty row
+    or column have no defined statistic and
+    return nan, where scipy would raise.
+
+    :param tbls:
+        np.ndarray, counts of shape (N, 2, 2) or (2, 2).
+    :param correction:
+        bool, apply the Yates correction.
+    :return (statistic, pvalue, dof, expected_freq):
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+        arrays of shape (N,), (N,), (N,) and (N, 2, 2).
+    """
+
+    observed = np.asarray(tbls, dtype=np.float64).reshape(-1, 2, 2)
+
+    row_totals = observed.sum(axis=2, keepdims=True)
+    col_totals = observed.sum(axis=1, keepdims=True)
+    total = observed.sum(axis=(1, 2), keepdims=True)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected_freq = row_totals * col_totals / total
+
+        if correction:
+            diff = expected_freq - observed
+            observed = observed + np.minimum(0.5, np.abs(diff)) * np.sign(diff)
+
+        statistic = ((observed - expected_freq) ** 2 / expected_freq).sum(axis=(1, 2))
+
+    untestable = ~np.all(expected_freq > 0, axis=(1, 2))
+    statistic[untestable] = np.nan
+
+    pvalue = special.chdtrc(1, statistic)
+    dof = np.ones(len(statistic), dtype=np.int64)
+
+    return statistic, pvalue, dof, expected_freq
+
+def gen_effect_sizes_2x2(
+    A: np.ndarray,
+    B: np.ndarray,
+    C: np.ndarray,
+    D: np.ndarray,
+    continuity_correction: float = 0.5,
+    ci: float = 0.95
+) -> Dict[str, np.ndarray]:
+
+    """
+    Effect sizes of a stack of 2x2 contingency
+    tables, from the cell counts.
+
+    A and B are the target group without and with
+    success, C and D the non-target group. Computes
+    the odds ratio of success with its log-scale
+    (Woolf) interval, the relative risk of success
+    (selection-rate ratio) with its log-scale
+    interval, and the Wilson score interval of each
+    group's selection rate. Tables with a zero cell
+    get continuity_correction added to every cell
+    for the odds ratio and relative risk.
+
+    :param A, B, C, D:
+        np.ndarray, cell counts.
+    :param continuity_correction:
+        float, value added to the cells of tables
+        with a zero cell.
+    :param ci:
+        float, confidence level.
+    :return effect_sizes:
+        Dict[str, np.ndarray], one array per column,
+        nan where undefined.
+    """
+
+    A, B, C, D = (np.asarray(i, dtype=np.float64) for i in (A, B, C, D))
+
+    z = special.ndtri((1 + ci) / 2)
+
+    # rates and Wilson intervals on the raw counts
+    n_target = A + B
+    n_non_target = C + D
+
+    effect_sizes: Dict[str, np.ndarray] = {}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name, succ, n in (
+            ('target_rate', B, n_target),
+            ('non_target_rate', D, n_non_target)
+        ):
+            p = succ / n
+            denom = 1 + z ** 2 / n
+            center = (p + z ** 2 / (2 * n)) / denom
+            half = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denom
+
+            effect_sizes[f'{name}_ci_lower'] = np.clip(center - half, 0, 1)
+            effect_sizes[f'{name}_ci_upper'] = np.clip(center + half, 0, 1)
+
+        zero = (A == 0) | (B == 0) | (C == 0) | (D == 0)
+        cc = np.where(zero, continuity_correction, 0.0)
+
+        A, B, C, D = A + cc, B + cc, C + cc, D + cc
+
+        log_or = np.log(B * C) - np.log(A * D)
+        se_or = np.sqrt(1 / A + 1 / B + 1 / C + 1 / D)
+
+        log_rr = np.log(B / (A + B)) - np.log(D / (C + D))
+        se_rr = np.sqrt(1 / B - 1 / (A + B) + 1 / D - 1 / (C + D))
+
+    for name, log_val, se in (
+        ('odds_ratio', log_or, se_or),
+        ('relative_risk', log_rr, se_rr)
+    ):
+        effect_sizes[name] = np.exp(log_val)
+        effect_sizes[f'{name}_ci_lower'] = np.exp(log_val - z * se)
+        effect_sizes[f'{name}_ci_upper'] = np.exp(log_val + z * se)
+
+    order = [
+        'odds_ratio',
+        'odds_ratio_ci_lower',
+        'odds_ratio_ci_upper',
+        'relative_risk',
+        'relative_risk_ci_lower',
+        'relative_risk_ci_upper',
+        'target_rate_ci_lower',
+        'target_rate_ci_upper',
+        'non_target_rate_ci_lower',
+        'non_target_rate_ci_upper'
+    ]
+
+    effect_sizes = {
+        name: np.where(np.isfinite(effect_sizes[name]), effect_sizes[name], np.nan)
+        for name in order
+    }
+
+    return effect_sizes
+
+def gen_adjusted_pvalues(
+    pvalue: np.ndarray,
+    method: str
+) -> np.ndarray:
+
+    """
+    Multiple-comparison adjusted pvalues over a
+    batch of tests, with a single sort.
+
+    Supports 'bonferroni', 'holm' (step-down
+    family-wise) and 'bh' (Benjamini-Hochberg false
+    discovery rate). nan pvalues are not counted as
+    tests and stay nan.
+
+    :param pvalue:
+        np.ndarray, raw pvalues.
+    :param method:
+        str, 'bonferroni', 'holm' or 'bh'.
+    :return pvalue_adjusted:
+        np.ndarray, adjusted pvalues capped at 1.
+    """
+
+    pvalue = np.asarray(pvalue, dtype=np.float64)
+
+    if method not in ('bonferroni', 'holm', 'bh'):
+        raise ValueError(
+            f"Unknown correction '{method}', expected 'bonferroni', 'holm' or 'bh'."
+        )
+
+    pvalue_adjusted = np.full(len(pvalue), np.nan)
+
+    valid = np.flatnonzero(~np.isnan(pvalue))
+    m = len(valid)
+
+    if method == 'bonferroni':
+        pvalue_adjusted[valid] = np.minimum(pvalue[valid] * m, 1)
+        return pvalue_adjusted
+
+    order = valid[np.argsort(pvalue[valid], kind='stable')]
+    p_sorted = pvalue[order]
+    rank = np.arange(1, m + 1)
+
+    if method == 'holm':
+        adjusted = np.maximum.accumulate(p_sorted * (m - rank + 1))
+
+    else:
+        adjusted = np.minimum.accumulate((p_sorted * m / rank)[::-1])[::-1]
+
+    pvalue_adjusted[order] = np.minimum(adjusted, 1)
+
+    return pvalue_adjusted
+
+def gen_cmh_2x2(
+    tbls: np.ndarray,
+    correction: bool = True,
+    ci: float = 0.95
+) -> Dict[str, float]:
+
+    """
+    Cochran-Mantel-Haenszel test and Mantel-Haenszel
+    common odds ratio over a stack of 2x2 strata.
+
+    Tests whether the target group's odds of success
+    differ from the non-target group's while holding
+    the stratum fixed. The odds ratio is oriented as
+    in gen_effect_sizes_2x2, target over non-target
+    odds of success, with a Robins-Breslow-Greenland
+    log-scale interval. Strata with fewer than two
+    rows carry no information and are left out.
+
+    :param tbls:
+        np.ndarray, counts of shape (n_strata, 2, 2).
+    :param correction:
+        bool, apply the 0.5 continuity correction.
+    :param ci:
+        float, confidence level.
+    :return cmh:
+        Dict[str, float], statistic, pvalue, dof,
+        common_odds_ratio, its ci bounds and n_strata.
+    """
+
+    tbls = np.asarray(tbls, dtype=np.float64).reshape(-1, 2, 2)
+
+    n = tbls.sum(axis=(1, 2))
+    tbls = tbls[n > 1]
+    n = n[n > 1]
+
+    A = tbls[:, 0, 0]
+    B = tbls[:, 0, 1]
+    C = tbls[:, 1, 0]
+    D = tbls[:, 1, 1]
+
+    r1 = A + B
+    r2 = C + D
+    c1 = A + C
+    c2 = B + D
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # B is the target successes, its null mean and variance
+        expected = r1 * c2 / n
+        variance = r1 * r2 * c1 * c2 / (n ** 2 * (n - 1))
+
+        dev = np.abs(B.sum() - expected.sum())
+        if correction:
+            dev = max(dev - 0.5, 0.0)
+
+        statistic = dev ** 2 / variance.sum()
+
+        R = B * C / n
+        S = A * D / n
+        P = (B + C) / n
+        Q = (A + D) / n
+
+        R_sum = R.sum()
+        S_sum = S.sum()
+
+        log_or = np.log(R_sum) - np.log(S_sum)
+        se = np.sqrt(
+            (P * R).sum() / (2 * R_sum ** 2)
+            + (P * S + Q * R).sum() / (2 * R_sum * S_sum)
+            + (Q * S).sum() / (2 * S_sum ** 2)
+        )
+
+    z = special.ndtri((1 + ci) / 2)
+
+    cmh = {
+        'statistic': float(statistic),
+        'pvalue': float(special.chdtrc(1, statistic)),
+        'dof': 1,
+        'common_odds_ratio': float(np.exp(log_or)),
+        'common_odds_ratio_ci_lower': float(np.exp(log_or - z * se)),
+        'common_odds_ratio_ci_upper': float(np.exp(log_or + z * se)),
+        'n_strata': len(tbls)
+    }
+
+    return cmh
+
+def gen_rolling_tables(
+    tensor: np.ndarray,
+    window: int
+) -> np.ndarray:
+
+    """
+    Rolling window sums of per-period count tables,
+    from one cumulative sum over the period axis.
+
+    :param tensor:
+        np.ndarray, counts of shape (n_periods, ...),
+        e.g. (n_periods, n_segments, 2, 2).
+    :param window:
+        int, number of periods per window.
+    :return windows:
+        np.ndarray, int64 counts of shape
+        (n_periods - window + 1, ...), entry t sums
+        periods t to t + window - 1.
+    """
+
+    tensor = np.asarray(tensor, dtype=np.int64)
+
+    if window <= 0:
+        raise ValueError("Expected 'window' to be a positive 'int'.")
+
+    csum = np.zeros((len(tensor) + 1,) + tensor.shape[1:], dtype=np.int64)
+    np.cumsum(tensor, axis=0, out=csum[1:])
+
+    windows = csum[window:] - csum[:-window]
+
+    return windows
+
+def gen_cell_index_2x2(
+    group: np.ndarray,
+    outcome: np.ndarray
+) -> np.ndarray:
+
+    """
+    Maps harmonized codes to the flat cell index of
+    the 2x2 table.
+
+    Target group (1) maps to row 0 and success (1)
+    to column 1, i.e. index = (1 - group) * 2 + outcome.
+
+    :param group:
+        np.ndarray, group_var_clean codes.
+    :param outcome:
+        np.ndarray, outcome_var_clean codes.
+    :return cell:
+        np.ndarray, int64 cell index in [0, 3],
+        -1 where either code is -1.
+    """
+
+    group = group.astype(np.int64)
+    outcome = outcome.astype(np.int64)
+
+    cell = (1 - group) * 2 + outcome
+    cell[(group < 0) | (outcome < 0)] = -1
+
+    return cell
+
+def gen_segment_codes(
+    codes: List[np.ndarray],
+    sizes: List[int]
+) -> np.ndarray:
+
+    """
+    Combines the codes of several segment columns
+    into one mixed radix code, the first column
+    most significant, so code order is the sorted
+    order of the value tuples.
+
+    :param codes:
+        List[np.ndarray], codes of every column, -1
+        for a missing value.
+    :param sizes:
+        List[int], number of values of every column.
+    :return flat:
+        np.ndarray, int64 codes, -1 where any column
+        is missing.
+    """
+
+    n = len(codes[0]) if codes else 0
+
+    missing = np.zeros(n, dtype=bool)
+    flat = np.zeros(n, dtype=np.int64)
+
+    for col_codes, size in zip(codes, sizes):
+        col_codes = col_codes.astype(np.int64)
+
+        missing |= col_codes < 0
+        flat = flat * size + col_codes
+
+    flat[missing] = -1
+
+    return flat
+
+def gen_cut(
+    values: np.ndarray,
+    bin_edges: List[float],
+    bin_labels: List[str]
+) -> pd.Categorical:
+
+    """
+    Labels an array of values with their bins in
+    one np.searchsorted call.
+
+    Same result as pd.cut(values, bins=bin_edges,
+    labels=bin_labels, include_lowest=True): bins
+    are closed on the right, the first bin also on
+    the left, values outside the edges and nan get
+    no label.
+
+    :param values:
+        np.ndarray, values to bin.
+    :param bin_edges:
+        List[float], increasing bin edges.
+    :param bin_labels:
+        List[str], one label per bin.
+    :return bins:
+        pd.Categorical, ordered bin labels.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    edges = np.asarray(bin_edges, dtype=np.float64)
+
+    codes = np.searchsorted(edges, values, side='left') - 1
+    codes[values == edges[0]] = 0
+    codes[(codes < 0) | (codes >= len(bin_labels))] = -1
+
+    bins = pd.Categorical.from_codes(
+        codes,
+        categories=bin_labels,
+        ordered=True
+    )
+
+    return bins
+
+_log_factorial = special.gammaln(np.arange(1, dtype=np.float64) + 1)
+
+def gen_log_factorial(
+    n: int
+) -> np.ndarray:
+
+    """
+    Returns the shared log-factorial table,
+    log(k!) for k in [0, n] at least.
+
+    The table is kept at module level and only
+    grows, so repeated batches reuse it.
+
+    :param n:
+        int, largest k needed.
+    :return log_factorial:
+        np.ndarray, log(k!) indexed by k.
+    """
+
+    global _log_factorial
+
+    if len(_log_factorial) <= n:
+        size = max(n + 1, 2 * len(_log_factorial))
+        _log_factorial = special.gammaln(np.arange(size, dtype=np.float64) + 1)
+
+    return _log_factorial
+
+def gen_fisher_exact_2x2(
+    tbls: np.ndarray,
+    block_size: int = 2 ** 22
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Two-sided Fisher exact test for a stack of
+    2x2 contingency tables.
+
+    Every table with the observed margins is scored
+    from the log-factorial table and the pvalue sums
+    the tables no more likely than the observed one,
+    as scipy.stats.fisher_exact does. Tables are
+    processed in blocks of at most block_size cells,
+    sorted by the width of their support.
+
+    :param tbls:
+        np.ndarray, counts of shape (N, 2, 2) or (2, 2).
+    :param block_size:
+        int, max number of support cells per block.
+    :return (statistic, pvalue):
+        Tuple[np.ndarray, np.ndarray], sample odds ratio
+        and pvalue, arrays of shape (N,). Tables with an
+        empty row or column get nan and 1, as in scipy.
+    """
+
+    tbls = np.asarray(tbls, dtype=np.int64).reshape(-1, 2, 2)
+
+    a = tbls[:, 0, 0]
+    b = tbls[:, 0, 1]
+    c = tbls[:, 1, 0]
+    d = tbls[:, 1, 1]
+
+    r1 = a + b
+    r2 = c + d
+    c1 = a + c
+    c2 = b + d
+    n = r1 + r2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        statistic = np.where(
+            (b > 0) & (c > 0),
+            (a * d) / (b * c),
+            np.inf
+        )
+
+    pvalue = np.ones(len(tbls), dtype=np.float64)
+
+    testable = (r1 > 0) & (r2 > 0) & (c1 > 0) & (c2 > 0)
+    statistic[~testable] = np.nan
+
+    if not testable.any():
+        return statistic, pvalue
+
+    lf = gen_log_factorial(int(n.max()))
+
+    lo = np.maximum(0, c1 - r2)
+    hi = np.minimum(r1, c1)
+    width = hi - lo + 1
+
+    idx = np.flatnonzero(testable)
+    idx = idx[np.argsort(width[idx], kind='stable')]
+
+    # tables within the relative tolerance count as as-extreme
+    log_tol = np.log1p(1e-7)
+
+    start = 0
+    while start < len(idx):
+        end = min(len(idx), start + max(1, block_size // width[idx[start]]))
+        end = start + max(1, block_size // width[idx[end - 1]])
+
+        blk = idx[start:end]
+        w = width[blk].max()
+
+        x = lo[blk, None] + np.arange(w)[None, :]
+        valid = x <= hi[blk, None]
+        x = np.minimum(x, hi[blk, None])
+
+        const = lf[r1[blk]] + lf[r2[blk]] + lf[c1[blk]] + lf[c2[blk]] - lf[n[blk]]
+
+        logp = const[:, None] - (
+            lf[x] 
+            + lf[r1[blk, None] - x] 
+            + lf[c1[blk, None] - x] 
+            + lf[r2[blk, None] - c1[blk, None] + x]
+        )
+        logp_obs = const - (lf[a[blk]] + lf[b[blk]] + lf[c[blk]] + lf[d[blk]])
+
+        keep = valid & (logp <= logp_obs[:, None] + log_tol)
+
+        # sequential sum, so the padding of a block
+        # never changes a table's pvalue
+        pvalue[blk] = np.minimum(
+            1.0,
+            np.where(keep, np.exp(logp), 0.0).cumsum(axis=1)[:, -1]
+        )
+
+        start = end
+
+    return statistic, pvalue
+
+def run_fisher_exact_2x2(
+    tbls: np.ndarray,
+    n_workers: int = 1,
+    chunk_size: int = 1024
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Runs gen_fisher_exact_2x2 over chunks of
+    chunk_size tables, on a process pool when
+    n_workers > 1.
+
+    :param tbls:
+        np.ndarray, counts of shape (N, 2, 2) or (2, 2).
+    :param n_workers:
+        int, number of worker processes.
+    :param chunk_size:
+        int, number of tables per task.
+    :return (statistic, pvalue):
+        Tuple[np.ndarray, np.ndarray], see gen_fisher_exact_2x2.
+    """
+
+    tbls = np.asarray(tbls, dtype=np.int64).reshape(-1, 2, 2)
+
+    chunks = [
+        tbls[i:i + chunk_size]
+        for i in range(0, len(tbls), chunk_size)
+    ]
+
+    if n_workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(gen_fisher_exact_2x2, chunks))
+
+    else:
+        results = [gen_fisher_exact_2x2(chunk) for chunk in chunks]
+
+    if not results:
+        return np.zeros(0), np.zeros(0)
+
+    statistic = np.concatenate([res[0] for res in results])
+    pvalue = np.concatenate([res[1] for res in results])
+
+    return statistic, pvalue
+
+def gen_permutation_2x2(
+    tbls: np.ndarray,
+    n_permutations: int,
+    seed: Optional[np.random.SeedSequence] = None,
+    alpha: Optional[float] = None,
+    block_size: int = 1000,
+    z: float = 3.29
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Monte Carlo permutation test for a stack of
+    2x2 contingency tables.
+
+    With the margins fixed, permuting the outcome
+    labels draws the top-left cell from a
+    hypergeometric distribution. Draws are made
+    block_size at a time for all active tables and
+    a draw counts when it is at least as far from
+    its expected value as the observed cell, which
+    is the two-sided chi2 ordering. When alpha is
+    given, a table stops early once alpha lies
+    outside the z interval of its running pvalue.
+
+    :param tbls:
+        np.ndarray, counts of shape (N, 2, 2) or (2, 2).
+    :param n_permutations:
+        int, max number of permutations per table.
+    :param seed:
+        Optional[np.random.SeedSequence], seed of the
+        random generator, any value np.random.default_rng
+        accepts.
+    :param alpha:
+        Optional[float], alpha for the early stop,
+        None runs all permutations.
+    :param block_size:
+        int, permutations drawn per block.
+    :param z:
+        float, width of the early stop interval.
+    :return (pvalue, n_used):
+        Tuple[np.ndarray, np.ndarray], the (hits + 1) /
+        (n_used + 1) pvalue and the permutations used per
+        table. Tables with an empty row or column get nan.
+    """
+
+    tbls = np.asarray(tbls, dtype=np.int64).reshape(-1, 2, 2)
+
+    a = tbls[:, 0, 0]
+    r1 = tbls[:, 0, :].sum(axis=1)
+    c1 = tbls[:, :, 0].sum(axis=1)
+    n = tbls.sum(axis=(1, 2))
+
+    testable = (r1 > 0) & (r1 < n) & (c1 > 0) & (c1 < n)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected_a = r1 * c1 / n
+
+    # small tolerance so ties with the observed table count
+    dev_obs = np.abs(a - expected_a) - 1e-7
+
+    rng = np.random.default_rng(seed)
+
+    hits = np.zeros(len(tbls), dtype=np.int64)
+    n_used = np.zeros(len(tbls), dtype=np.int64)
+
+    active = np.flatnonzero(testable)
+    done = 0
+
+    while len(active) and done < n_permutations:
+        m = min(block_size, n_permutations - done)
+
+        draws = rng.hypergeometric(
+            c1[active, None],
+            (n - c1)[active, None],
+            r1[active, None],
+            size=(len(active), m)
+        )
+
+        hits[active] += (
+            np.abs(draws - expected_a[active, None]) >= dev_obs[active, None]
+        ).sum(axis=1)
+
+        done += m
+        n_used[active] = done
+
+        if alpha is not None:
+            p = (hits[active] + 1) / (done + 1)
+            se = np.sqrt(p * (1 - p) / done)
+            active = active[np.abs(p - alpha) <= z * se]
+
+    pvalue = np.full(len(tbls), np.nan)
+    pvalue[testable] = (hits[testable] + 1) / (n_used[testable] + 1)
+
+    return pvalue, n_used
+
+def run_permutation_2x2(
+    tbls: np.ndarray,
+    n_permutations: int,
+    seed: Optional[int] = None,
+    alpha: Optional[float] = None,
+    block_size: int = 1000,
+    n_workers: int = 1,
+    chunk_size: int = 256
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Runs gen_permutation_2x2 over chunks of
+    chunk_size tables, on a process pool when
+    n_workers > 1, see _run_chunks.
+
+    :param tbls:
+        np.ndarray, counts of shape (N, 2, 2) or (2, 2).
+    :param n_permutations:
+        int, max number of permutations per table.
+    :param seed:
+        Optional[int], seed, None draws fresh entropy.
+    :param alpha:
+        Optional[float], alpha for the early stop.
+    :param block_size:
+        int, permutations drawn per block.
+    :param n_workers:
+        int, number of worker processes.
+    :param chunk_size:
+        int, number of tables per task.
+    :return (pvalue, n_used):
+        Tuple[np.ndarray, np.ndarray], see gen_permutation_2x2.
+    """
+
+    results = _run_chunks(
+        gen_permutation_2x2,
+        tbls,
+        seed,
+        n_workers,
+        chunk_size,
+        n_permutations,
+        alpha=alpha,
+        block_size=block_size
+    )
+
+    if not results:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+
+    pvalue = np.concatenate([res[0] for res in results])
+    n_used = np.concatenate([res[1] for res in results])
+
+    return pvalue, n_used
+
+def gen_bootstrap_2x2(
+    tbls: np.ndarray,
+    n_boot: int,
+    seed: Optional[np.random.SeedSequence] = None,
+    ci: float = 0.95,
+    block_size: int = 2 ** 22
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Percentile bootstrap confidence intervals for
+    the four-fifths ratio and the phi coefficient
+    of a stack of 2x2 contingency tables.
+
+    Each table is resampled from a multinomial on
+    its own cell proportions, for all tables at
+    once and at most block_size cells per draw.
+    Resamples where a value is undefined, e.g. an
+    empty group, are left out of its interval.
+
+    :param tbls:
+        np.ndarray, counts of shape (N, 2, 2) or (2, 2).
+    :param n_boot:
+        int, number of bootstrap resamples.
+    :param seed:
+        Optional[np.random.SeedSequence], seed of the
+        random generator.
+    :param ci:
+        float, confidence level.
+    :param block_size:
+        int, max number of cells drawn at once.
+    :return (ratio_ci, phi_ci):
+        Tuple[np.ndarray, np.ndarray], lower and upper
+        bounds, both of shape (N, 2), nan for empty tables.
+    """
+
+    tbls = np.asarray(tbls, dtype=np.int64).reshape(-1, 4)
+
+    n = tbls.sum(axis=1)
+    valid = np.flatnonzero(n > 0)
+
+    ratio_ci = np.full((len(tbls), 2), np.nan)
+    phi_ci = np.full((len(tbls), 2), np.nan)
+
+    if not len(valid):
+        return ratio_ci, phi_ci
+
+    rng = np.random.default_rng(seed)
+
+    pvals = tbls[valid] / n[valid, None]
+
+    ratio = np.empty((n_boot, len(valid)))
+    phi = np.empty((n_boot, len(valid)))
+
+    boots_per_block = max(1, block_size // (4 * len(valid)))
+
+    for start in range(0, n_boot, boots_per_block):
+        m = min(boots_per_block, n_boot - start)
+
+        draws = rng.multinomial(
+            n[valid], 
+            pvals, 
+            size=(m, len(valid))
+        )
+
+        ratio[start:start + m], phi[start:start + m] = gen_ratio_phi(draws)
+
+    q = [100 * (1 - ci) / 2, 100 * (1 + ci) / 2]
+
+    with warnings.catch_warnings():
+        # tables with no defined resample give an all-nan slice
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        ratio_ci[valid] = np.nanpercentile(ratio, q, axis=0).T
+        phi_ci[valid] = np.nanpercentile(phi, q, axis=0).T
+
+    return ratio_ci, phi_ci
+
+def gen_ratio_phi(
+    counts: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Four-fifths ratio and phi coefficient from
+    flattened 2x2 counts [A, B, C, D].
+
+    :param counts:
+        np.ndarray, counts of shape (..., 4).
+    :return (ratio, phi):
+        Tuple[np.ndarray, np.ndarray], nan where
+        undefined.
+    """
+
+    counts = counts.astype(np.float64)
+
+    A = counts[..., 0]
+    B = counts[..., 1]
+    C = counts[..., 2]
+    D = counts[..., 3]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = (B / (A + B)) / (D / (C + D))
+        phi = (A * D - B * C) / np.sqrt((A + B) * (C + D) * (A + C) * (B + D))
+
+    ratio[~np.isfinite(ratio)] = np.nan
+    phi[~np.isfinite(phi)] = np.nan
+
+    return ratio, phi
+
+def run_bootstrap_2x2(
+    tbls: np.ndarray,
+    n_boot: int,
+    seed: Optional[int] = None,
+    ci: float = 0.95,
+    n_workers: int = 1,
+    chunk_size: int = 256
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Runs gen_bootstrap_2x2 over chunks of
+    chunk_size tables, on a process pool when
+    n_workers > 1, see _run_chunks.
+
+    :param tbls:
+        np.ndarray, counts of shape (N, 2, 2) or (2, 2).
+    :param n_boot:
+        int, number of bootstrap resamples.
+    :param seed:
+        Optional[int], seed, None draws fresh entropy.
+    :param ci:
+        float, confidence level.
+    :param n_workers:
+        int, number of worker processes.
+    :param chunk_size:
+        int, number of tables per task.
+    :return (ratio_ci, phi_ci):
+        Tuple[np.ndarray, np.ndarray], see gen_bootstrap_2x2.
+    """
+
+    results = _run_chunks(
+        gen_bootstrap_2x2,
+        tbls,
+        seed,
+        n_workers,
+        chunk_size,
+        n_boot,
+        ci=ci
+    )
+
+    if not results:
+        return np.zeros((0, 2)), np.zeros((0, 2))
+
+    ratio_ci = np.concatenate([res[0] for res in results])
+    phi_ci = np.concatenate([res[1] for res in results])
+
+    return ratio_ci, phi_ci
+
+def _run_chunks(
+    func: Callable[..., Any],
+    tbls: np.ndarray,
+    seed: Optional[int],
+    n_workers: int,
+    chunk_size: int,
+    *args: Any,
+    **kwargs: Any
+) -> List[Any]:
+
+    """
+    Calls func(chunk, *args, seed=child, **kwargs) on
+    chunks of chunk_size tables, on a process pool
+    when n_workers > 1.
+
+    Every chunk gets its own child of one
+    SeedSequence, so results depend on the seed
+    and chunk_size but not on the number of
+    workers.
+
+    :return results:
+        List[Any], func results in chunk order.
+    """
+
+    tbls = np.asarray(tbls, dtype=np.int64).reshape(-1, 2, 2)
+
+    chunks = [
+        tbls[i:i + chunk_size]
+        for i in range(0, len(tbls), chunk_size)
+    ]
+
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+
+    tasks = [
+        partial(func, chunk, *args, seed=child, **kwargs)
+        for chunk, child in zip(chunks, seeds)
+    ]
+
+    if n_workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_run_task, tasks))
+
+    else:
+        results = [task() for task in tasks]
+
+    return results
+
+def _run_task(
+    task: Callable[[], Any]
+) -> Any:
+
+    """
+    Calls a task in a worker process.
+    """
+
+    return task()
+
+def run_atomic_write(
+    filepath: str,
+    write: Callable[[BinaryIO], None]
+) -> None:
+
+    """
+    Writes a file through a temp file in the same
+    directory that is renamed over filepath, so
+    readers never see a partially written file.
+
+    :param filepath:
+        str, absolute output path.
+    :param write:
+        Callable[[BinaryIO], None], writes the content
+        to the open binary file.
+    """
+
+    fp_tmp = f"{filepath}.{os.getpid()}.tmp"
+
+    try:
+        with open(fp_tmp, "wb") as f:
+            write(f)
+
+        os.replace(fp_tmp, filepath)
+
+    finally:
+        if os.path.exists(fp_tmp):
+            os.remove(fp_tmp)
+
+def gen_shared_arrays(
+    arrays: Dict[str, np.ndarray]
+) -> Tuple[List[shared_memory.SharedMemory], Dict[str, Tuple[str, Tuple[int, ...], str]]]:
+
+    """
+    Copies arrays into shared memory blocks so worker
+    processes can attach to them by name instead of
+    receiving pickled copies.
+
+    The caller owns the blocks and must close and
+    unlink them, see gen_release_shared.
+
+    :param arrays:
+        Dict[str, np.ndarray], arrays by name.
+    :return (blocks, spec):
+        Tuple[List[SharedMemory], Dict[str, Tuple[str, Tuple[int, ...], str]]],
+        the blocks and, per array, the block name,
+        shape and dtype to pass to gen_attach_arrays.
+    """
+
+    blocks = []
+    spec = {}
+
+    try:
+        for key, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            block = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            blocks.append(block)
+
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=block.buf)[...] = arr
+            spec[key] = (block.name, arr.shape, arr.dtype.str)
+
+    except Exception:
+        gen_release_shared(blocks)
+        raise
+
+    return blocks, spec
+
+def gen_attach_arrays(
+    spec: Dict[str, Tuple[str, Tuple[int, ...], str]]
+) -> Tuple[List[shared_memory.SharedMemory], Dict[str, np.ndarray]]:
+
+    """
+    Attaches to the shared memory blocks of
+    gen_shared_arrays, without copying.
+
+    The arrays are only valid while the returned
+    blocks are open; close them once done.
+
+    :param spec:
+        Dict[str, Tuple[str, Tuple[int, ...], str]],
+        see gen_shared_arrays.
+    :return (blocks, arrays):
+        Tuple[List[SharedMemory], Dict[str, np.ndarray]].
+    """
+
+    blocks = []
+    arrays = {}
+
+    for key, (name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+
+        arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+    return blocks, arrays
+
+def gen_release_shared(
+    blocks: List[shared_memory.SharedMemory],
+    unlink: bool = True
+) -> None:
+
+    """
+    Closes, and by default unlinks, shared
+    memory blocks.
+
+    :param blocks:
+        List[SharedMemory], blocks to release.
+    :param unlink:
+        bool, also free the blocks, only the
+        creating process should.
+    """
+
+    for block in blocks:
+        block.close()
+
+        if unlink:
+            block.unlink()
+
+def run_count_segments(
+    spec: Dict[str, Tuple[str, Tuple[int, ...], str]],
+    row_start: int,
+    row_end: int,
+    sizes: List[int],
+    dense: bool
+) -> Tuple[Optional[np.ndarray], np.ndarray]:
+
+    """
+    Counts the rows [row_start, row_end) of the
+    shared harmonized codes in a worker process.
+
+    The 'group' and 'outcome' arrays and the
+    'grpers_<i>' segment column codes are read from
+    shared memory. Every row with a segment adds one
+    to the slot segment * 5 + cell + 1 of its
+    combined code, slot 0 counting the rows outside
+    the table, so segments seen without a counted
+    row are kept.
+
+    :param spec:
+        Dict[str, Tuple[str, Tuple[int, ...], str]],
+        see gen_shared_arrays.
+    :param row_start, row_end:
+        int, row range.
+    :param sizes:
+        List[int], number of values of every segment
+        column, see gen_segment_codes.
+    :param dense:
+        bool, bincount over the whole code space
+        instead of returning only the seen slots.
+    :return (slots, counts):
+        Tuple[Optional[np.ndarray], np.ndarray], the counted
+        slots, None when dense, and their int64 counts.
+    """
+
+    blocks, arrays = gen_attach_arrays(spec)
+
+    try:
+        cell = gen_cell_index_2x2(
+            group=arrays['group'][row_start:row_end],
+            outcome=arrays['outcome'][row_start:row_end]
+        )
+        flat = gen_segment_codes(
+            [arrays[f'grpers_{i}'][row_start:row_end] for i in range(len(sizes))],
+            sizes
+        )
+
+        del arrays
+
+    finally:
+        gen_release_shared(blocks, unlink=False)
+
+    valid = flat >= 0
+    index = flat[valid] * 5 + cell[valid] + 1
+
+    if dense:
+        n_flat = int(np.prod(sizes, dtype=np.int64))
+        return None, np.bincount(index, minlength=n_flat * 5).astype(np.int64)
+
+    slots, counts = np.unique(index, return_counts=True)
+
+    return slots, counts.astype(np.int64)
+
+def run_sweep_variant(
+    config: Dict[str, Any],
+    spec: Dict[str, Tuple[str, Tuple[int, ...], str]],
+    categories: Dict[str, pd.Index]
+) -> Any:
+
+    """
+    Counts the tables of one sweep variant from the
+    shared categorical code arrays in a worker
+    process, see Model.run_sweep.
+
+    :param config:
+        Dict[str, Any], config of the variant.
+    :param spec:
+        Dict[str, Tuple[str, Tuple[int, ...], str]],
+        codes of every input column, see gen_shared_arrays.
+    :param categories:
+        Dict[str, pd.Index], categories of every
+        input column.
+    :return tbl:
+        the batch mode tables or the 2x2 cont table,
+        as Model.prep_tables.
+    """
+
+    # model_classes imports this module
+    import src.model_classes as mc
+
+    blocks, codes = gen_attach_arrays(spec)
+
+    try:
+        prep = mc.Ingest(config)
+
+        df = pd.DataFrame(
+            {
+                col: pd.Categorical.from_codes(
+                    codes[col],
+                    categories=categories[col]
+                )
+                for col in prep._gen_usecols()
+            }
+        )
+
+        trans = mc.Transform(df=prep.run_harmonize(df))
+
+        if prep.batch:
+            tbl = trans.run_build_cont_tables(grpers=prep.grpers)
+        else:
+            tbl = trans.run_build_cont_table()
+
+        del df, trans, codes
+
+    finally:
+        gen_release_shared(blocks, unlink=False)
+
+    return tbl
+
+def run_partial(
+    config: Dict[str, Any],
+    filepath: str
+) -> None:
+
+    """
+    Counts the input of config into a CountPartial
+    saved at filepath in a worker process, see
+    Model.run_map_reduce.
+
+    :param config:
+        Dict[str, Any], config of the shard.
+    :param filepath:
+        str, output .npz path relative to the main dir.
+    """
+
+    # model_classes imports this module
+    import src.model_classes as mc
+
+    prep = mc.Ingest(config)
+
+    if prep.chunksize is not None:
+        tbls = mc.Transform.run_build_cont_tables_stream(
+            chunks=prep.run_stream(),
+            grpers=prep.grpers
+        )
+
+        if not prep.batch:
+            tbls = {prep.grpers_val: tbls.get(prep.grpers_val, [[0, 0], [0, 0]])}
+
+    elif prep.batch:
+        tbls = mc.Transform(df=prep.run()).run_build_cont_tables(
+            grpers=prep.grpers
+        )
+    else:
+        tbls = {prep.grpers_val: mc.Transform(df=prep.run()).run_build_cont_table()}
+
+    mc.CountPartial.from_tables(tbls, prep).save(filepath)